@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+JPEG encoder benchmark for the /video_feed pipeline
+Compares per-frame CPU time of the available backends on synthetic 1280x720 frames
+"""
+
+import sys
+import time
+import numpy as np
+import av
+
+from go2_video import JPEG_BACKENDS
+
+WIDTH, HEIGHT = 1280, 720
+FRAMES = 200
+QUALITY = 80
+
+
+def make_frames(count):
+    """Build moving-gradient yuv420p frames, like the ones the H.264 decoder produces"""
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, WIDTH, dtype=np.float32)
+    y = np.linspace(0, 255, HEIGHT, dtype=np.float32)[:, None]
+    frames = []
+    for i in range(count):
+        img = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        img[..., 0] = (x + i * 4) % 256
+        img[..., 1] = (y + i * 2) % 256
+        img[..., 2] = rng.integers(0, 64, (HEIGHT, WIDTH), dtype=np.uint8) + 96
+        frame = av.VideoFrame.from_ndarray(img, format="bgr24").reformat(format="yuv420p")
+        frames.append(frame)
+    return frames
+
+
+def bench(encoder, frames):
+    encoder.encode(frames[0], QUALITY)  # Warm up
+    size = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for frame in frames:
+        size += len(encoder.encode(frame, QUALITY))
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    return cpu / len(frames), wall / len(frames), size / len(frames)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+
+    print("=" * 60)
+    print(f"JPEG Encoder Benchmark - {count} frames @ {WIDTH}x{HEIGHT}, quality {QUALITY}")
+    print("=" * 60)
+
+    print("Generating synthetic yuv420p frames...")
+    frames = make_frames(count)
+
+    results = {}
+    for name, backend in JPEG_BACKENDS.items():
+        try:
+            encoder = backend()
+        except Exception as e:
+            print(f"  {name:10s} skipped: {e}")
+            continue
+        cpu, wall, size = bench(encoder, frames)
+        results[name] = cpu
+        print(f"  {name:10s} cpu {cpu * 1000:7.2f} ms/frame | "
+              f"wall {wall * 1000:7.2f} ms/frame | {size / 1024:6.1f} KiB/frame")
+
+    if 'opencv' in results and 'turbojpeg' in results:
+        print(f"\n  turbojpeg (YUV-native) uses {results['turbojpeg'] / results['opencv'] * 100:.0f}% "
+              f"of the OpenCV path's CPU per frame")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
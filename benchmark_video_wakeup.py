@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Frame delivery microbenchmark for /video_feed viewers
+Compares the old 33 ms sleep-poll loop with the event-driven FrameSlot:
+idle CPU with 20 viewers and no frames, then publish-to-wakeup latency
+"""
+
+import statistics
+import sys
+import threading
+import time
+
+from go2_video import FrameSlot
+
+VIEWERS = 20
+IDLE_SECONDS = 3.0
+FRAMES = 100
+FRAME_INTERVAL = 1 / 30
+
+
+class PollingSlot:
+    """The old delivery model: viewers check for a frame, else sleep 33 ms"""
+
+    def __init__(self):
+        self.seq = 0
+        self.frame = None
+
+    def publish(self, frame):
+        self.frame = frame
+        self.seq += 1
+
+    def get(self, last_seq, stop):
+        while not stop.is_set():
+            if self.seq > last_seq:
+                return self.seq, self.frame
+            time.sleep(0.033)
+        return last_seq, None
+
+
+class EventSlot:
+    """FrameSlot adapter with the same interface as PollingSlot"""
+
+    def __init__(self):
+        self.slot = FrameSlot()
+
+    def publish(self, frame):
+        self.slot.publish(frame)
+
+    def get(self, last_seq, stop):
+        return self.slot.get(last_seq)
+
+    def wake_all(self):
+        self.slot.clear()
+
+
+def viewer(slot, stop, latencies):
+    last_seq = 0
+    while not stop.is_set():
+        last_seq, published = slot.get(last_seq, stop)
+        if published is not None:
+            latencies.append(time.perf_counter() - published)
+
+
+def run(name, slot):
+    stop = threading.Event()
+    latencies = []
+    threads = [threading.Thread(target=viewer, args=(slot, stop, latencies), daemon=True)
+               for _ in range(VIEWERS)]
+    for t in threads:
+        t.start()
+
+    # Idle phase: no frames at all
+    time.sleep(0.2)
+    cpu_start = time.process_time()
+    time.sleep(IDLE_SECONDS)
+    idle_cpu = time.process_time() - cpu_start
+
+    # Delivery phase: 30 fps, payload is the publish timestamp
+    for _ in range(FRAMES):
+        slot.publish(time.perf_counter())
+        time.sleep(FRAME_INTERVAL)
+
+    stop.set()
+    for t in threads:
+        while t.is_alive():
+            if hasattr(slot, 'wake_all'):
+                slot.wake_all()
+            t.join(timeout=0.01)
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"  {name:13s} idle cpu {idle_cpu / IDLE_SECONDS * 100:6.2f}% of a core | "
+          f"wake-up p50 {p50:6.2f} ms | p99 {p99:6.2f} ms | {len(latencies)} deliveries")
+
+
+def main():
+    global VIEWERS
+    if len(sys.argv) > 1:
+        VIEWERS = int(sys.argv[1])
+
+    print("=" * 60)
+    print(f"Video Delivery Benchmark - {VIEWERS} viewers")
+    print("=" * 60)
+    run("sleep-poll", PollingSlot())
+    run("event-driven", EventSlot())
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Movement command path helpers shared by the Go2 web interfaces
+"""
+
+import asyncio
+import json
+import time
+
+
+class VelocityFilter:
+    """Quantizes outbound velocities and suppresses sends that barely change.
+
+    Velocities are snapped to a resolution grid. A command is only passed
+    on when some axis moved by at least threshold since the last one sent,
+    when it is a transition to or from a standstill, or when keepalive_ms
+    has passed (so the robot keeps receiving a steady, low-rate stream
+    while the joystick is held still).
+    """
+
+    def __init__(self, resolution=0.01, threshold=0.02, keepalive_ms=200):
+        self.resolution = resolution
+        self.threshold = threshold
+        self.keepalive = keepalive_ms / 1000.0
+        self._last = None
+        self._last_sent_at = 0.0
+        self.changed = False
+        self.received = 0
+        self.sent_changes = 0
+        self.sent_keepalives = 0
+        self.suppressed = 0
+
+    def reset(self):
+        self._last = None
+
+    def quantize(self, velocity):
+        return tuple(round(round(v / self.resolution) * self.resolution, 6) for v in velocity)
+
+    def apply(self, velocity, now):
+        """Return the quantized velocity to send, or None if the send is suppressed"""
+        self.received += 1
+        velocity = self.quantize(velocity)
+        last = self._last
+        self.changed = (
+            last is None
+            or max(abs(a - b) for a, b in zip(velocity, last)) >= self.threshold
+            or (not any(velocity)) != (not any(last))
+        )
+        if self.changed:
+            self.sent_changes += 1
+        elif now - self._last_sent_at >= self.keepalive:
+            self.sent_keepalives += 1
+        else:
+            self.suppressed += 1
+            return None
+        self._last = velocity
+        self._last_sent_at = now
+        return velocity
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'sent_changes': self.sent_changes,
+            'sent_keepalives': self.sent_keepalives,
+            'suppressed': self.suppressed,
+            'saved_pct': round(self.suppressed / self.received * 100, 1) if self.received else 0.0,
+        }
+
+
+class VelocityCommandSlot:
+    """Latest-wins velocity target drained by one publisher task on the asyncio loop.
+
+    Producers (HTTP handlers, the joystick WebSocket) only overwrite the
+    pending velocity and return. The publisher sends whatever is newest
+    once the previous publish_request_new has completed, so velocities that
+    arrive while a send is in flight are merged instead of queued and the
+    robot never works through a backlog of stale commands.
+    """
+
+    def __init__(self, send, command_filter=None):
+        self._send = send  # async callable(vx, vy, vz)
+        self.filter = command_filter
+        self._pending = None
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+        self.updates = 0
+        self.sent = 0
+        self.merged = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the publisher task on the running loop (call from inside the loop)"""
+        self.stop()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._pending = None
+        self._task = self._loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def put(self, vx, vy, vz):
+        """Make (vx, vy, vz) the next velocity to send (loop thread only)"""
+        if self._pending is not None:
+            self.merged += 1
+        self._pending = (vx, vy, vz)
+        self.updates += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def put_threadsafe(self, vx, vy, vz):
+        """put() from a Flask worker thread; returns immediately"""
+        self._loop.call_soon_threadsafe(self.put, vx, vy, vz)
+
+    def discard(self):
+        """Drop a pending velocity that has not been sent yet (loop thread only)"""
+        if self._pending is not None:
+            self.merged += 1
+            self._pending = None
+
+    def discard_threadsafe(self):
+        self._loop.call_soon_threadsafe(self.discard)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            velocity, self._pending = self._pending, None
+            if velocity is None:
+                continue
+            if self.filter is not None:
+                velocity = self.filter.apply(velocity, self._loop.time())
+                if velocity is None:
+                    continue
+                if self.filter.changed:
+                    print(f"🕹️ Move: vx={velocity[0]:.2f}, vy={velocity[1]:.2f}, vz={velocity[2]:.2f}")
+            try:
+                await self._send(*velocity)
+                self.sent += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Movement send error: {e}")
+
+    def stats(self):
+        return {
+            'mode': 'on_demand',
+            'updates': self.updates,
+            'sent': self.sent,
+            'merged': self.merged,
+            'errors': self.errors,
+            'filter': self.filter.stats() if self.filter else None,
+        }
+
+
+class VelocityStreamer:
+    """Publishes the target velocity at a fixed rate from the asyncio loop.
+
+    The send rate is set by the server, not by browser timers or network
+    jitter: commands are issued on loop.time() deadlines (period = 1/rate_hz)
+    and do not wait for the previous acknowledgement, with at most
+    max_in_flight unacknowledged sends. If no client update arrives for
+    deadman_ms, the output is ramped to zero at the given deceleration
+    limits. Once the output has reached zero and a final zero command has
+    been sent, the task idles until the next non-zero target; zero updates
+    while idle only feed the deadman and never send another zero Move.
+
+    Same interface as VelocityCommandSlot, so either can drive the joystick.
+    """
+
+    def __init__(self, send, rate_hz=20, deadman_ms=500, linear_decel=2.0,
+                 angular_decel=3.0, max_in_flight=3, command_filter=None):
+        self._send = send  # async callable(vx, vy, vz)
+        self.filter = command_filter
+        self.rate_hz = rate_hz
+        self.deadman = deadman_ms / 1000.0
+        self.linear_decel = linear_decel
+        self.angular_decel = angular_decel
+        self.max_in_flight = max_in_flight
+        self._target = (0.0, 0.0, 0.0)
+        self._output = (0.0, 0.0, 0.0)
+        self._last_update = 0.0
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+        self._in_flight = 0
+        self._deadman_active = False
+        self._idle = False  # Parked: output zero and the final zero already sent
+        self.updates = 0
+        self.sent = 0
+        self.errors = 0
+        self.deadline_misses = 0
+        self.in_flight_skips = 0
+        self.deadman_trips = 0
+        self.max_lateness = 0.0
+        self.active_time = 0.0  # Seconds spent streaming (idle time excluded)
+
+    def start(self):
+        """Start the streaming task on the running loop (call from inside the loop)"""
+        self.stop()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._target = self._output = (0.0, 0.0, 0.0)
+        self._idle = False
+        if self.filter is not None:
+            self.filter.reset()
+        self._task = self._loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def put(self, vx, vy, vz):
+        """Set the target velocity and feed the deadman (loop thread only)"""
+        self._last_update = self._loop.time()
+        self.updates += 1
+        if self._idle and not (vx or vy or vz):
+            return  # Zeros from idle pages must not wake the task: a zero Move drops the gait
+        self._target = (vx, vy, vz)
+        self._wakeup.set()
+
+    def put_threadsafe(self, vx, vy, vz):
+        self._loop.call_soon_threadsafe(self.put, vx, vy, vz)
+
+    def discard(self):
+        """Explicit stop from the client: target zero, still feeds the deadman"""
+        self.put(0.0, 0.0, 0.0)
+
+    def discard_threadsafe(self):
+        self._loop.call_soon_threadsafe(self.discard)
+
+    def _step_towards(self, target, dt):
+        """Move the output towards target, limiting deceleration on every axis (deadman ramp)"""
+        limits = (self.linear_decel * dt, self.linear_decel * dt, self.angular_decel * dt)
+        output = []
+        for current, wanted, limit in zip(self._output, target, limits):
+            if abs(wanted) >= abs(current) and wanted * current >= 0:
+                output.append(wanted)  # Speeding up follows the operator directly
+            else:
+                value = current + max(-limit, min(limit, wanted - current))
+                if wanted == 0 and abs(value) < 1e-6:
+                    value = 0.0  # Land exactly on zero so the streamer can go idle
+                output.append(value)
+        return tuple(output)
+
+    async def _publish(self, velocity):
+        self._in_flight += 1
+        try:
+            await self._send(*velocity)
+            self.sent += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Movement send error: {e}")
+        finally:
+            self._in_flight -= 1
+
+    async def _run(self):
+        loop = self._loop
+        period = 1.0 / self.rate_hz
+        zero = (0.0, 0.0, 0.0)
+        deadline = loop.time()
+        while True:
+            if self._output == zero and self._target == zero:
+                self._idle = True
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                self._idle = False
+                deadline = loop.time()
+
+            now = loop.time()
+            target = self._target
+            if now - self._last_update > self.deadman:
+                if not self._deadman_active and target != zero:
+                    self.deadman_trips += 1
+                    print("⚠️ Velocity deadman: no client update, ramping to zero")
+                self._deadman_active = True
+                target = self._target = zero
+            else:
+                self._deadman_active = False
+
+            # Client targets (including a release to zero) are followed directly;
+            # only the deadman stop is ramped, since nobody is steering then
+            self._output = self._step_towards(target, period) if self._deadman_active else target
+            if self._in_flight >= self.max_in_flight:
+                self.in_flight_skips += 1
+            else:
+                velocity = self._output
+                if self.filter is not None:
+                    # None: unchanged since the last send and keepalive not due yet
+                    velocity = self.filter.apply(velocity, now)
+                    if velocity is not None and self.filter.changed:
+                        print(f"🕹️ Move: vx={velocity[0]:.2f}, vy={velocity[1]:.2f}, vz={velocity[2]:.2f}")
+                if velocity is not None:
+                    loop.create_task(self._publish(velocity))
+
+            # Deadline scheduling: the period never absorbs send time, and
+            # missed slots are skipped instead of sent in a burst
+            deadline += period
+            self.active_time += period
+            now = loop.time()
+            lateness = now - deadline
+            if lateness > 0:
+                self.max_lateness = max(self.max_lateness, lateness)
+                missed = int(lateness // period) + 1
+                self.deadline_misses += missed
+                deadline += missed * period
+            await asyncio.sleep(deadline - loop.time())
+
+    def stats(self):
+        return {
+            'mode': 'stream',
+            'rate_hz': self.rate_hz,
+            'updates': self.updates,
+            'sent': self.sent,
+            'actual_rate_hz': round(self.sent / self.active_time, 2) if self.active_time else 0.0,
+            'errors': self.errors,
+            'deadline_misses': self.deadline_misses,
+            'max_lateness_ms': round(self.max_lateness * 1000, 2),
+            'in_flight_skips': self.in_flight_skips,
+            'deadman_trips': self.deadman_trips,
+            'deadman_active': self._deadman_active,
+            'filter': self.filter.stats() if self.filter else None,
+        }
+
+
+class MotionModeSwitcher:
+    """Puts the robot into a motion mode and remembers the last confirmed one.
+
+    After a switch request (MOTION_SWITCHER api_id 1002) the mode is polled
+    with api_id 1001 under a short exponential backoff until the robot
+    reports the wanted mode or timeout passes, instead of sleeping a fixed
+    time. A confirmed mode is cached per robot (key, usually the IP) for
+    cache_ttl seconds, so a quick reconnect skips the query altogether.
+    """
+
+    def __init__(self, publish, topic, timeout=5.0, initial_delay=0.1, max_delay=0.8, cache_ttl=60.0):
+        self._publish = publish  # async callable(topic, payload) -> response
+        self.topic = topic
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.cache_ttl = cache_ttl
+        self._cached = None  # (key, mode, monotonic time confirmed)
+        self.queries = 0
+        self.switches = 0
+        self.cache_hits = 0
+        self.timeouts = 0
+        self.last_switch_time = None
+
+    def cached_mode(self, key):
+        """The cached mode for key if it is still fresh, else None"""
+        if self._cached is None:
+            return None
+        cached_key, mode, confirmed_at = self._cached
+        if cached_key != key or time.monotonic() - confirmed_at > self.cache_ttl:
+            return None
+        return mode
+
+    def invalidate(self):
+        self._cached = None
+
+    async def query(self):
+        """Current mode name from api_id 1001, or None if the robot reports an error"""
+        self.queries += 1
+        response = await self._publish(self.topic, {"api_id": 1001})
+        if response['data']['header']['status']['code'] != 0:
+            return None
+        return json.loads(response['data']['data'])['name']
+
+    async def ensure(self, mode, key=None):
+        """Switch to mode unless already in it; returns a summary dict of what happened"""
+        if self.cached_mode(key) == mode:
+            self.cache_hits += 1
+            return {'mode': mode, 'cached': True, 'switched': False, 'confirmed': True}
+
+        self.invalidate()
+        current = await self.query()
+        if current is None:
+            raise RuntimeError("Motion mode query returned an error code")
+        if current == mode:
+            self._cached = (key, mode, time.monotonic())
+            return {'mode': mode, 'cached': False, 'switched': False, 'confirmed': True}
+
+        print(f"Switching from '{current}' to '{mode}' mode...")
+        self.switches += 1
+        started = time.monotonic()
+        await self._publish(self.topic, {"api_id": 1002, "parameter": {"name": mode}})
+        delay = self.initial_delay
+        polls = 0
+        while True:
+            await asyncio.sleep(min(delay, max(0.0, started + self.timeout - time.monotonic())))
+            polls += 1
+            try:
+                current = await self.query()
+            except Exception as e:
+                current = None  # The switcher can be unresponsive mid-switch
+                print(f"Motion mode poll error: {e}")
+            if current == mode:
+                self.last_switch_time = time.monotonic() - started
+                self._cached = (key, mode, time.monotonic())
+                return {'mode': mode, 'cached': False, 'switched': True, 'confirmed': True,
+                        'polls': polls, 'switch_ms': round(self.last_switch_time * 1000, 1)}
+            if time.monotonic() - started >= self.timeout:
+                self.timeouts += 1
+                return {'mode': current, 'cached': False, 'switched': True, 'confirmed': False,
+                        'polls': polls, 'switch_ms': round((time.monotonic() - started) * 1000, 1)}
+            delay = min(delay * 1.5, self.max_delay)
+
+    def stats(self):
+        cached = self._cached
+        return {
+            'cached_mode': cached[1] if cached else None,
+            'cache_age_s': round(time.monotonic() - cached[2], 1) if cached else None,
+            'queries': self.queries,
+            'switches': self.switches,
+            'cache_hits': self.cache_hits,
+            'timeouts': self.timeouts,
+            'last_switch_ms': round(self.last_switch_time * 1000, 1) if self.last_switch_time is not None else None,
+        }
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events bus for the Go2 web interfaces
+Pushes connection, velocity and sequence progress to every open dashboard
+"""
+
+import json
+import threading
+from collections import deque
+
+
+class EventBus:
+    """Thread-safe fan-out of named events to any number of SSE streams.
+
+    Events are appended to a bounded history with increasing ids, and every
+    waiting stream is woken through a condition variable. Streams keep their
+    own cursor, so a slow client only falls behind itself, and a reconnecting
+    EventSource resumes after its Last-Event-ID while that event is still in
+    the history.
+    """
+
+    def __init__(self, history=256):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._state = {}
+        self.subscribers = 0
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, name, data, state=False):
+        """Send event name with JSON-serializable data to every stream (any thread).
+
+        With state=True the payload is also remembered as the latest value
+        of name and replayed to streams that connect later.
+        """
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, name, data))
+            if state:
+                self._state[name] = data
+            self._cond.notify_all()
+
+    def subscribe(self, last_id=None, heartbeat=15):
+        """Yield (id, name, data) tuples; (None, None, None) is a heartbeat tick"""
+        with self._cond:
+            self.subscribers += 1
+            if last_id is None or last_id > self._last_id:
+                cursor = self._last_id
+                initial = [(cursor, name, data) for name, data in self._state.items()]
+            else:
+                cursor = last_id
+                initial = []
+        try:
+            for event in initial:
+                yield event
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._last_id > cursor, heartbeat)
+                    pending = [event for event in self._events if event[0] > cursor]
+                if not pending:
+                    yield None, None, None
+                    continue
+                for event in pending:
+                    cursor = event[0]
+                    yield event
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+
+def format_sse(event_id, name, data):
+    """Encode one event in text/event-stream wire format"""
+    if name is None:
+        return ': keepalive\n\n'
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Lightweight runtime metrics for the Go2 web interfaces
+Prometheus text exposition without extra dependencies - cheap enough for
+the 10-50 Hz command hot path (one dict lookup, one bisect, one lock)
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from sub-millisecond publishes to slow sequence steps
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _CounterChild:
+    def __init__(self, lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    def __init__(self, lock, buckets):
+        self._lock = lock
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class _Family:
+    """A metric name with a fixed set of label names; children are created on first use"""
+
+    def __init__(self, name, help_text, labelnames, factory):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        key = tuple(str(kwargs[n]) for n in self.labelnames) if kwargs else tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory(self._lock))
+        return child
+
+    def items(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class Counter(_Family):
+    type = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames, _CounterChild)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render(self):
+        for key, child in self.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {child.value}"
+
+
+class Histogram(_Family):
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames,
+                         lambda lock: _HistogramChild(lock, self.buckets))
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render(self):
+        for key, child in self.items():
+            with self._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class CallbackGauge:
+    """Gauge (or counter) whose value is read from a callback at scrape time.
+
+    The callback returns a number, or a dict mapping a label value tuple to
+    a number. Used for state that is already counted elsewhere, like the
+    video pipeline counters, so the hot path pays nothing extra.
+    """
+
+    def __init__(self, name, help_text, callback, labelnames=(), type='gauge'):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.type = type
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for key, v in value.items():
+                yield f"{self.name}{_format_labels(self.labelnames, key)} {float(v)}"
+        elif value is not None:
+            yield f"{self.name} {float(value)}"
+
+
+class MetricsRegistry:
+    """Holds all metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge_callback(self, name, help_text, callback, labelnames=(), type='gauge'):
+        return self._register(CallbackGauge(name, help_text, callback, labelnames, type))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class LoopLagMonitor:
+    """Measures how late the asyncio loop wakes up from a fixed short sleep.
+
+    Anything that blocks the loop thread (frame conversion, JPEG encoding,
+    slow callbacks) shows up directly as lag, and delays every
+    publish_request_new issued on the same loop.
+    """
+
+    def __init__(self, interval=0.05, histogram=None):
+        self.interval = interval
+        self.histogram = histogram  # Optional Histogram fed with every sample
+        self._task = None
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+
+    def start(self):
+        """Start sampling on the running loop (call from inside the loop)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self.reset()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - start - self.interval))
+
+    def record(self, lag):
+        self.samples += 1
+        self.last_lag = lag
+        if self.histogram is not None:
+            self.histogram.observe(lag)
+        self.max_lag = max(self.max_lag, lag)
+        # Exponential moving average, ~20 samples of memory
+        self.avg_lag += (lag - self.avg_lag) * (1.0 if self.samples == 1 else 0.05)
+
+    def stats(self):
+        return {
+            'samples': self.samples,
+            'last_ms': round(self.last_lag * 1000, 2),
+            'avg_ms': round(self.avg_lag * 1000, 2),
+            'max_ms': round(self.max_lag * 1000, 2),
+        }
+
+
+class PhaseTimer:
+    """Splits one operation (e.g. /connect) into consecutive named phases.
+
+    mark(name) closes the phase that began at the previous mark, so the
+    phases never overlap and add up to the total. note(name) records a
+    point in time since the start without closing a phase, for things that
+    happen in the background after the operation has finished.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = self._last = time.perf_counter()
+        self.phases = {}
+        self.notes = {}
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases[name] = now - self._last
+        self._last = now
+
+    def note(self, name):
+        if name not in self.notes:
+            self.notes[name] = time.perf_counter() - self.started
+
+    def stats(self):
+        return {
+            'phases_ms': {name: round(value * 1000, 1) for name, value in self.phases.items()},
+            'total_ms': round((self._last - self.started) * 1000, 1),
+            **{f'{name}_ms': round(value * 1000, 1) for name, value in self.notes.items()},
+        }
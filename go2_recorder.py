@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Passthrough use of the Go2 camera stream
+Taps the H.264 access units aiortc receives, muxes them into time-rotated
+MP4 segments with PyAV and forwards them to browser WebRTC peers - no
+decoding or re-encoding
+"""
+
+import asyncio
+import av
+import os
+import queue
+import threading
+import time
+from fractions import Fraction
+
+from aiortc import MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+
+RTP_CLOCK = Fraction(1, 90000)  # RTP video timestamps tick at 90 kHz
+
+
+def install_packet_tap(pc, track, callback):
+    """Forward every encoded frame of track to callback(data, timestamp) before aiortc decodes it.
+
+    aiortc does not expose encoded media, so this wraps put() on the
+    receiver's decoder queue. Each item is (codec, JitterFrame) where the
+    frame data is an Annex-B H.264 access unit and the timestamp is the
+    90 kHz RTP timestamp. Returns True if installed.
+    """
+    receiver = None
+    for candidate in pc.getReceivers() if pc else []:
+        if candidate.track is track:
+            receiver = candidate
+            break
+    decoder_queue = getattr(receiver, '_RTCRtpReceiver__decoder_queue', None)
+    if decoder_queue is None:
+        print("⚠️  Could not find the video receiver - recording unavailable")
+        return False
+
+    original_put = decoder_queue.put
+
+    def put(item, *args, **kwargs):
+        if item is not None:
+            codec, encoded_frame = item
+            if codec.mimeType.lower() == 'video/h264':
+                callback(encoded_frame.data, encoded_frame.timestamp)
+        return original_put(item, *args, **kwargs)
+
+    decoder_queue.put = put
+    return True
+
+
+def _nal_types(data):
+    """NAL unit types in an Annex-B access unit"""
+    types = set()
+    start = data.find(b'\x00\x00\x01')
+    while start != -1 and start + 3 < len(data):
+        types.add(data[start + 3] & 0x1f)
+        start = data.find(b'\x00\x00\x01', start + 3)
+    return types
+
+
+class PassthroughVideoTrack(MediaStreamTrack):
+    """Browser-facing track that returns the robot's H.264 access units as av.Packets.
+
+    aiortc's RTCRtpSender only packetizes packets (H264Encoder.pack) instead
+    of encoding frames, so the peer must negotiate H.264. A track that falls
+    behind drops its backlog and resumes at the next keyframe, since
+    P-frames without their reference would only decode to garbage.
+    """
+
+    kind = 'video'
+
+    def __init__(self, relay, queue_size):
+        super().__init__()
+        self._relay = relay
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._waiting_keyframe = True
+        self._origin = None
+        self.dropped = 0
+
+    def _push(self, item, keyframe):
+        """Queue one (data, position) access unit (loop thread only)"""
+        if self._waiting_keyframe and not keyframe:
+            self.dropped += 1
+            return
+        if self._queue.full():
+            self.dropped += self._queue.qsize()
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            if not keyframe:
+                self._waiting_keyframe = True
+                self.dropped += 1
+                return
+        self._waiting_keyframe = False
+        self._queue.put_nowait(item)
+
+    async def recv(self):
+        if self.readyState != 'live':
+            raise MediaStreamError
+        item = await self._queue.get()
+        if item is None:
+            raise MediaStreamError
+        data, position = item
+        if self._origin is None:
+            self._origin = position
+        packet = av.Packet(data)
+        packet.pts = position - self._origin
+        packet.time_base = RTP_CLOCK
+        return packet
+
+    def stop(self):
+        super().stop()
+        self._relay._tracks.discard(self)
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)  # Wakes a pending recv()
+
+
+class H264Relay:
+    """Fans the tapped H.264 access units out to browser WebRTC peers.
+
+    feed() is a packet tap callback and runs on the asyncio loop. Every
+    peer gets the robot's own encoded stream, so a viewer costs
+    packetization and bandwidth but no decoding or encoding. A new track
+    starts with the current GOP (everything since the last keyframe), so
+    the browser can show a picture straight away instead of waiting for
+    the robot's next keyframe.
+    """
+
+    def __init__(self, queue_size=300):
+        self.queue_size = queue_size
+        self._tracks = set()
+        self.reset()
+
+    def reset(self):
+        """Forget the stream and end every track (on disconnect)"""
+        for track in list(self._tracks):
+            track.stop()
+        self.available = False  # Set once the tap is installed on the robot track
+        self._gop = []
+        self._last_timestamp = None
+        self._position = 0
+        self.access_units = 0
+
+    def feed(self, data, timestamp):
+        if self._last_timestamp is not None:
+            # 32-bit RTP timestamps wrap; a small backwards step stays negative
+            delta = (timestamp - self._last_timestamp) & 0xffffffff
+            self._position += delta - (1 << 32) if delta >= 1 << 31 else delta
+        self._last_timestamp = timestamp
+        self.access_units += 1
+        nal_types = _nal_types(data)
+        keyframe = 5 in nal_types and 7 in nal_types  # SPS + IDR: decodable on its own
+        item = (bytes(data), self._position)
+        if keyframe:
+            self._gop = [item]
+        elif self._gop:
+            self._gop.append(item)
+            if len(self._gop) > self.queue_size:
+                self._gop = []  # Too long to replay; new peers wait for the next keyframe
+        for track in list(self._tracks):
+            track._push(item, keyframe)
+
+    def subscribe(self):
+        """New track for one browser peer (loop thread only)"""
+        track = PassthroughVideoTrack(self, self.queue_size)
+        for i, item in enumerate(self._gop):
+            track._push(item, i == 0)
+        self._tracks.add(track)
+        return track
+
+    def stats(self):
+        return {
+            'available': self.available,
+            'peers': len(self._tracks),
+            'access_units': self.access_units,
+            'gop_length': len(self._gop),
+            'dropped': sum(track.dropped for track in self._tracks),
+        }
+
+
+class SegmentRecorder:
+    """Muxes the tapped H.264 stream into MP4 segments on a background thread.
+
+    feed() is called on the asyncio loop for every access unit and only does
+    a non-blocking queue put, so a slow disk never stalls the loop (chunks are
+    dropped and counted instead). Each access unit becomes one packet timed
+    by its RTP timestamp, so the file keeps the camera's real frame timing.
+    Segments roll over on the first keyframe after segment_seconds, and the
+    oldest segments are deleted whenever the directory grows beyond budget_mb.
+    start() can override both for a single recording; the constructor values
+    stay the defaults for the next one.
+    """
+
+    def __init__(self, directory='recordings', segment_seconds=60, budget_mb=2048):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.budget_mb = budget_mb
+        self._settings = (segment_seconds, budget_mb)  # In effect for the running recording
+        self._chunks = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.recording = False
+        self.current_segment = None
+        self.segments_written = 0
+        self.segments_evicted = 0
+        self.chunks_dropped = 0
+        self.bytes_in = 0
+
+    def start(self, segment_seconds=None, budget_mb=None):
+        """Begin recording; returns False if a recording is already running"""
+        with self._lock:
+            if self.recording:
+                return False
+            self._settings = (segment_seconds or self.segment_seconds,
+                              budget_mb or self.budget_mb)
+            os.makedirs(self.directory, exist_ok=True)
+            self._chunks = queue.Queue(maxsize=600)
+            self._thread = threading.Thread(target=self._run, args=(self._chunks, *self._settings),
+                                            daemon=True)
+            self.recording = True
+            self._thread.start()
+            return True
+
+    def stop(self, timeout=5):
+        """Finish the current segment and stop; returns False if nothing was recording"""
+        with self._lock:
+            if not self.recording:
+                return False
+            self.recording = False
+            chunks, thread = self._chunks, self._thread
+        # The end marker must get through even if the queue is full
+        while True:
+            try:
+                chunks.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                try:
+                    chunks.get_nowait()
+                except queue.Empty:
+                    pass
+        thread.join(timeout=timeout)
+        return True
+
+    def feed(self, data, timestamp):
+        """Queue one Annex-B access unit with its RTP timestamp (called on the asyncio loop)"""
+        if not self.recording:
+            return
+        try:
+            self._chunks.put_nowait((bytes(data), timestamp))
+            self.bytes_in += len(data)
+        except queue.Full:
+            self.chunks_dropped += 1
+
+    def _run(self, chunks, segment_seconds, budget_mb):
+        output = None
+        try:
+            out_stream = None
+            segment_started = 0.0
+            last_timestamp = None
+            position = 0  # Unwrapped RTP time since the first chunk
+            offset = None
+            last_dts = None
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                data, timestamp = chunk
+                if last_timestamp is not None:
+                    # 32-bit RTP timestamps wrap; a small backwards step stays negative
+                    delta = (timestamp - last_timestamp) & 0xffffffff
+                    position += delta - (1 << 32) if delta >= 1 << 31 else delta
+                last_timestamp = timestamp
+                nal_types = _nal_types(data)
+                keyframe = 5 in nal_types
+                if output is None and not (keyframe and 7 in nal_types):
+                    continue  # Every segment must start with SPS/PPS + IDR
+                if output is not None and keyframe and \
+                        time.monotonic() - segment_started >= segment_seconds:
+                    self._close_segment(output, budget_mb)
+                    output = None
+                if output is None:
+                    output, out_stream = self._open_segment()
+                    segment_started = time.monotonic()
+                    offset = position
+                    last_dts = None
+                dts = position - offset
+                if last_dts is not None and dts <= last_dts:
+                    dts = last_dts + 1  # MP4 needs strictly increasing timestamps
+                last_dts = dts
+                packet = av.Packet(data)
+                packet.pts = packet.dts = dts
+                packet.time_base = RTP_CLOCK
+                packet.is_keyframe = keyframe
+                packet.stream = out_stream
+                output.mux(packet)
+        except Exception as e:
+            print(f"Recording error: {e}")
+        finally:
+            if output is not None:
+                self._close_segment(output, budget_mb)
+            self.recording = False
+            self.current_segment = None
+
+    def _open_segment(self):
+        # Millisecond stamp plus a suffix if taken, so quick rollovers never overwrite.
+        # The name is reserved with an exclusive create because the muxer only
+        # writes the file once the first packet arrives.
+        now = time.time()
+        stem = time.strftime("go2_%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now * 1000) % 1000:03d}"
+        suffix = 0
+        while True:
+            path = os.path.join(self.directory, f"{stem}_{suffix}.mp4" if suffix else f"{stem}.mp4")
+            try:
+                open(path, 'xb').close()
+                break
+            except FileExistsError:
+                suffix += 1
+        output = av.open(path, 'w', format='mp4')
+        # No encoder is opened: the muxer takes SPS/PPS from the first packet
+        out_stream = output.add_stream('h264')
+        out_stream.time_base = RTP_CLOCK
+        self.current_segment = path
+        print(f"🎥 Recording segment {path}")
+        return output, out_stream
+
+    def _close_segment(self, output, budget_mb):
+        try:
+            output.close()
+            self.segments_written += 1
+        except Exception as e:
+            print(f"⚠️  Could not finalize segment: {e}")
+        self.current_segment = None
+        self._enforce_budget(budget_mb)
+
+    def _enforce_budget(self, budget_mb):
+        """Delete the oldest segments until the directory fits in budget_mb"""
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith('go2_') and name.endswith('.mp4'):
+                path = os.path.join(self.directory, name)
+                segments.append((os.path.getmtime(path), os.path.getsize(path), path))
+        segments.sort()
+        total = sum(size for _, size, _ in segments)
+        budget = budget_mb * 1024 * 1024
+        while segments and total > budget:
+            _, size, path = segments.pop(0)
+            try:
+                os.remove(path)
+                total -= size
+                self.segments_evicted += 1
+                print(f"🗑️  Evicted old recording {path}")
+            except OSError as e:
+                print(f"⚠️  Could not evict {path}: {e}")
+                break
+
+    def stats(self):
+        segment_seconds, budget_mb = self._settings if self.recording else \
+            (self.segment_seconds, self.budget_mb)
+        return {
+            'recording': self.recording,
+            'current_segment': self.current_segment,
+            'segment_seconds': segment_seconds,
+            'budget_mb': budget_mb,
+            'segments_written': self.segments_written,
+            'segments_evicted': self.segments_evicted,
+            'chunks_dropped': self.chunks_dropped,
+            'bytes_in': self.bytes_in,
+        }
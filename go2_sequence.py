@@ -0,0 +1,1028 @@
+#!/usr/bin/env python3
+"""
+Movement sequence execution helpers shared by the Go2 web interfaces
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+import selectors
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+ACTIVATION_DELAY = 0.5    # Pause after the StopMove that opens a sequence
+REACTIVATION_DELAY = 0.3  # Pause after re-sending StopMove following a command step
+
+
+class SequenceError(ValueError):
+    """A sequence failed validation; errors lists one message per bad step"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+class SequenceExistsError(KeyError):
+    """A sequence with this id is already stored"""
+
+
+class MoveStep(namedtuple('MoveStep', ['index', 'duration', 'velocity', 'payload', 'stop_after'])):
+    __slots__ = ()
+    action = 'move'
+
+
+class CommandStep(namedtuple('CommandStep', ['index', 'duration', 'command', 'payload', 'reactivate'])):
+    __slots__ = ()
+    action = 'command'
+
+
+class WaitStep(namedtuple('WaitStep', ['index', 'duration'])):
+    __slots__ = ()
+    action = 'wait'
+
+
+# ramp/curve: profile is an (n, 3) array of velocities, payloads the matching prebuilt Moves
+ProfileStep = namedtuple('ProfileStep', ['index', 'action', 'duration', 'velocity', 'profile',
+                                         'payloads', 'stop_after'])
+
+PROFILE_ACTIONS = ('ramp', 'curve')
+MOTION_ACTIONS = ('move',) + PROFILE_ACTIONS  # Steps that need movement mode
+
+
+class SequencePlan:
+    """Validated sequence with every robot message built ahead of time"""
+
+    def __init__(self, steps, activate_payload, stop_payload, warnings=(), activate=True, step_count=None):
+        self.steps = steps
+        # Steps in the submitted sequence; optimize_plan() can leave fewer in self.steps
+        self.step_count = len(steps) if step_count is None else step_count
+        self.activate_payload = activate_payload
+        self.stop_payload = stop_payload
+        self.warnings = list(warnings)
+        self.activate = activate  # Send the opening StopMove
+        self.optimization = None  # Report from optimize_plan()
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def estimated_duration(self):
+        """Seconds from start to finish, including the movement-mode pauses"""
+        total = ACTIVATION_DELAY if self.activate else 0.0
+        for step in self.steps:
+            total += step.duration
+            if step.action == 'command' and step.reactivate:
+                total += REACTIVATION_DELAY
+        return round(total, 3)
+
+    def describe(self):
+        steps = []
+        for step in self.steps:
+            info = {'action': step.action, 'step': step.index + 1, 'duration': step.duration}
+            if step.action in MOTION_ACTIONS:
+                info['velocity'] = list(step.velocity)
+            if step.action in PROFILE_ACTIONS:
+                info['commands'] = len(step.payloads)
+                info['peak'] = np.abs(step.profile).max(axis=0).round(4).tolist()
+            elif step.action == 'command':
+                info['command'] = step.command
+            steps.append(info)
+        return steps
+
+
+class SequenceCompiler:
+    """Turns the JSON step list from the UI into a SequencePlan.
+
+    Every step is checked before anything is sent: unknown actions and
+    commands, non-numeric values, non-positive durations, steps longer than
+    max_step_duration and sequences longer than max_total_duration are
+    collected and raised together as a SequenceError. Velocities beyond
+    the limits are clamped, with a warning on the plan.
+
+    ramp and curve steps are turned into a NumPy velocity profile with one
+    row per command at rate_hz. Both start from the velocity the previous
+    step ended on and approach their target along a straight line in
+    velocity space, so all axes arrive together (a curve keeps its radius
+    while speeding up), within linear_accel / angular_accel.
+    - ramp: {vx, vy, vz} target, duration optional (defaults to the ramp time)
+    - curve: {speed, radius} (radius > 0 turns left) plus duration or angle (rad)
+    """
+
+    def __init__(self, command_mapping, sport_cmd, max_linear_speed, max_angular_speed, optimize=True,
+                 rate_hz=10, linear_accel=1.0, angular_accel=2.0, max_step_duration=60.0,
+                 max_total_duration=600.0):
+        self.command_mapping = command_mapping
+        self.sport_cmd = sport_cmd
+        self.limits = (max_linear_speed, max_linear_speed, max_angular_speed)
+        self.optimize = optimize
+        self.rate_hz = rate_hz
+        self.accel = (linear_accel, linear_accel, angular_accel)
+        self.max_step_duration = max_step_duration
+        self.max_total_duration = max_total_duration
+
+    @staticmethod
+    def _number(step, key, default, errors, label):
+        value = step.get(key, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            errors.append(f"{label}: {key} must be a number, got {value!r}")
+            return None
+        return float(value)
+
+    def _clamp(self, label, values, warnings):
+        clamped = []
+        for key, value, limit in zip(('vx', 'vy', 'vz'), values, self.limits):
+            bounded = max(-limit, min(limit, value))
+            if bounded != value:
+                warnings.append(f"{label}: {key}={value} clamped to {bounded}")
+            clamped.append(bounded)
+        return tuple(clamped)
+
+    def _profile(self, start, target, duration=None, angle=None):
+        """Velocity rows for one ramp/curve step, one per command period.
+
+        The ramp time is that of the slowest axis, and every axis covers its
+        share of the change in the same time. Without a duration the profile
+        ends once the target is reached, or once the yaw turned in the
+        curve's direction reaches angle (yaw lost while a previous opposite
+        turn decelerates through zero counts against it).
+        Raises SequenceError if the step would run longer than max_step_duration,
+        before any rows are allocated.
+        """
+        start = np.asarray(start, dtype=float)
+        delta = np.asarray(target, dtype=float) - start
+        ramp_time = float(np.max(np.abs(delta) / np.asarray(self.accel)))
+        limit = self.max_step_duration
+        if ramp_time > limit:
+            raise SequenceError([f"{ramp_time:.1f}s ramp exceeds the {limit}s step limit"])
+
+        def fractions(count):
+            t = np.arange(1, count + 1) / self.rate_hz
+            return np.clip(t / ramp_time, 0.0, 1.0) if ramp_time > 0 else np.ones(count)
+
+        if angle is not None:
+            # Yaw turned (in the curve's direction) by the end of the ramp, then
+            # the cruise at the target rate that covers the rest of the angle
+            direction = math.copysign(1.0, target[2])
+            ramp_count = max(1, math.ceil(ramp_time * self.rate_hz - 1e-9))
+            ramp_yaw = float(np.sum(start[2] + fractions(ramp_count) * delta[2])) * direction / self.rate_hz
+            remaining = abs(angle) - ramp_yaw
+            cruise = max(0.0, remaining) / abs(target[2]) if target[2] else math.inf
+            if ramp_count / self.rate_hz + cruise > limit:
+                raise SequenceError([f"turning {angle} rad at {target[2]} rad/s takes "
+                                     f"{ramp_count / self.rate_hz + cruise:.1f}s, over the {limit}s step limit"])
+            count = ramp_count + math.ceil(cruise * self.rate_hz) + 1  # Trimmed below
+        else:
+            steps = ramp_time if duration is None else duration
+            if steps > limit:
+                raise SequenceError([f"{steps:.1f}s exceeds the {limit}s step limit"])
+            count = max(1, math.ceil(steps * self.rate_hz - 1e-9))
+
+        limits = np.asarray(self.limits)
+        # Never exceed MAX_*_SPEED, whatever the inputs
+        profile = np.clip(start + fractions(count)[:, None] * delta, -limits, limits)
+        if angle is not None:
+            turned = np.cumsum(profile[:, 2]) * direction / self.rate_hz
+            reached = turned >= abs(angle) - 1e-9
+            if not reached.any():
+                raise SequenceError([f"curve never turns {angle} rad"])
+            profile = profile[:int(np.argmax(reached)) + 1]
+        return profile
+
+    def compile(self, sequence):
+        if not isinstance(sequence, list) or not sequence:
+            raise SequenceError(['Empty sequence'])
+
+        errors = []
+        warnings = []
+        steps = []
+        velocity = (0.0, 0.0, 0.0)  # What the previous step ended on; ramps and curves start here
+        for i, step in enumerate(sequence):
+            label = f"Step {i + 1}"
+            if not isinstance(step, dict):
+                errors.append(f"{label}: expected an object, got {step!r}")
+                continue
+            action = step.get('action')
+            if action in PROFILE_ACTIONS and 'duration' not in step:
+                duration = None  # Derived from the ramp time or the curve angle
+            else:
+                duration = self._number(step, 'duration', 1.0, errors, label)
+                if duration is not None and (duration < 0 or (duration == 0 and action != 'command')):
+                    errors.append(f"{label}: duration must be positive, got {duration}")
+                    continue
+                if duration is not None and duration > self.max_step_duration:
+                    errors.append(f"{label}: duration {duration} exceeds the {self.max_step_duration}s step limit")
+                    continue
+                if duration is None:
+                    continue
+            previous = steps[-1] if steps and steps[-1].index == i - 1 else None
+            start = velocity if previous is not None and previous.action in MOTION_ACTIONS else (0.0, 0.0, 0.0)
+            velocity = (0.0, 0.0, 0.0)
+
+            if action == 'move':
+                values = [self._number(step, key, 0.0, errors, label) for key in ('vx', 'vy', 'vz')]
+                if None in values:
+                    continue
+                velocity = self._clamp(label, values, warnings)
+                payload = {"api_id": 1008, "parameter": {"x": velocity[0], "y": velocity[1], "z": velocity[2]}}
+                steps.append(MoveStep(i, duration, velocity, payload, True))
+
+            elif action in PROFILE_ACTIONS:
+                angle = None
+                if action == 'ramp':
+                    values = [self._number(step, key, 0.0, errors, label) for key in ('vx', 'vy', 'vz')]
+                    if None in values:
+                        continue
+                    target = self._clamp(label, values, warnings)
+                else:
+                    speed = self._number(step, 'speed', None, errors, label)
+                    radius = self._number(step, 'radius', None, errors, label)
+                    if 'angle' in step:
+                        angle = self._number(step, 'angle', None, errors, label)
+                        if angle is None:
+                            continue
+                    if speed is None or radius is None:
+                        continue
+                    if radius == 0 or speed == 0:
+                        errors.append(f"{label}: curve needs a non-zero speed and radius")
+                        continue
+                    if duration is None and angle is None:
+                        errors.append(f"{label}: curve needs a duration or an angle")
+                        continue
+                    target = self._clamp(label, (speed, 0.0, speed / radius), warnings)
+                    if angle is not None and angle * target[2] < 0:
+                        errors.append(f"{label}: angle {angle} turns against radius {radius}")
+                        continue
+                try:
+                    profile = self._profile(start, target, duration, None if duration is not None else angle)
+                except SequenceError as e:
+                    errors.extend(f"{label}: {error}" for error in e.errors)
+                    continue
+                rows = np.round(profile, 4).tolist()
+                payloads = [{"api_id": 1008, "parameter": {"x": x, "y": y, "z": z}} for x, y, z in rows]
+                velocity = tuple(rows[-1])
+                steps.append(ProfileStep(i, action, round(len(rows) / self.rate_hz, 6), velocity,
+                                         profile, payloads, True))
+
+            elif action == 'command':
+                command = step.get('command')
+                sport_cmd = self.command_mapping.get(command)
+                if sport_cmd is None or sport_cmd not in self.sport_cmd:
+                    errors.append(f"{label}: unknown command {command!r}")
+                    continue
+                payload = {"api_id": self.sport_cmd[sport_cmd]}
+                # Commands like StandUp, Sit, Damp leave movement mode; StopMove itself does not
+                steps.append(CommandStep(i, duration, command, payload, sport_cmd != 'StopMove'))
+
+            elif action == 'wait':
+                steps.append(WaitStep(i, duration))
+
+            else:
+                errors.append(f"{label}: unknown action {action!r}")
+
+        if errors:
+            raise SequenceError(errors)
+        plan = SequencePlan(
+            steps,
+            activate_payload={"api_id": self.sport_cmd["StopMove"]},
+            stop_payload={"api_id": 1008, "parameter": {"x": 0.0, "y": 0.0, "z": 0.0}},
+            warnings=warnings,
+        )
+        if plan.estimated_duration > self.max_total_duration:
+            raise SequenceError([f"Sequence takes {plan.estimated_duration}s, "
+                                 f"over the {self.max_total_duration}s limit"])
+        return optimize_plan(plan) if self.optimize else plan
+
+
+def optimize_plan(plan):
+    """Return a copy of plan without dead time between steps.
+
+    - adjacent moves with the same velocity become one move
+    - no zero-velocity stop between back-to-back moves, ramps and curves
+    - after a command, movement mode is only re-activated if the next
+      step that is not a wait moves the robot
+    - no opening StopMove when the sequence starts with the stop command
+
+    The report of what changed is stored on plan.optimization.
+    """
+    steps = []
+    merged = 0
+    for step in plan.steps:
+        previous = steps[-1] if steps else None
+        if step.action == 'move' and previous is not None and previous.action == 'move' \
+                and previous.velocity == step.velocity:
+            steps[-1] = previous._replace(duration=round(previous.duration + step.duration, 6))
+            merged += 1
+        else:
+            steps.append(step)
+
+    stops_skipped = 0
+    reactivations_skipped = 0
+    for i, step in enumerate(steps):
+        following = next((s for s in steps[i + 1:] if s.action != 'wait'), None)
+        if step.action in MOTION_ACTIONS and step.stop_after and i + 1 < len(steps) \
+                and steps[i + 1].action in MOTION_ACTIONS:
+            steps[i] = step._replace(stop_after=False)
+            stops_skipped += 1
+        elif step.action == 'command' and step.reactivate and (following is None or following.action not in MOTION_ACTIONS):
+            steps[i] = step._replace(reactivate=False)
+            reactivations_skipped += 1
+
+    optimized = SequencePlan(steps, plan.activate_payload, plan.stop_payload, plan.warnings,
+                             activate=plan.activate, step_count=plan.step_count)
+    if steps and steps[0].action == 'command' and steps[0].payload == plan.activate_payload:
+        optimized.activate = False
+    optimized.optimization = {
+        'merged_moves': merged,
+        'stops_skipped': stops_skipped,
+        'reactivations_skipped': reactivations_skipped,
+        'activation_skipped': plan.activate and not optimized.activate,
+        'time_saved': round(plan.estimated_duration - optimized.estimated_duration, 3),
+    }
+    return optimized
+
+
+class DeadlineScheduler:
+    """Sends a command on fixed loop.time() deadlines for the length of a step.
+
+    Deadlines are start + k / rate_hz, so the period never absorbs the send
+    round trip and a step of duration seconds always issues the same number
+    of commands. Sends are started as tasks on their deadline rather than
+    after the previous acknowledgement, with at most max_in_flight of them
+    outstanding. run() returns once the full step duration has elapsed.
+    """
+
+    def __init__(self, rate_hz=10, max_in_flight=3):
+        self.rate_hz = rate_hz
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+
+    async def _publish(self, request, stats):
+        self._in_flight += 1
+        try:
+            await request
+            stats['acknowledged'] += 1
+        except Exception as e:
+            stats['errors'] += 1
+            print(f"  ⚠️  Movement command failed: {e}")
+        finally:
+            self._in_flight -= 1
+
+    async def run(self, send, duration):
+        """Call the async send(k) on deadline k for duration seconds; returns step stats"""
+        loop = asyncio.get_running_loop()
+        period = 1.0 / self.rate_hz
+        stats = {'scheduled': max(1, math.ceil(duration * self.rate_hz - 1e-9)),
+                 'sent': 0, 'acknowledged': 0, 'errors': 0, 'in_flight_skips': 0}
+        errors = []
+        start = loop.time()
+        for k in range(stats['scheduled']):
+            deadline = start + k * period
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            errors.append(loop.time() - deadline)
+            if self._in_flight >= self.max_in_flight:
+                stats['in_flight_skips'] += 1
+                continue
+            loop.create_task(self._publish(send(k), stats))
+            stats['sent'] += 1
+        remaining = start + duration - loop.time()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        elapsed = loop.time() - start
+
+        stats.update({
+            'rate_hz': self.rate_hz,
+            'duration': round(elapsed, 3),
+            'actual_rate_hz': round(stats['sent'] / elapsed, 2) if elapsed > 0 else 0.0,
+            'mean_error_ms': round(sum(errors) / len(errors) * 1000, 2) if errors else 0.0,
+            'max_error_ms': round(max(errors) * 1000, 2) if errors else 0.0,
+            'drift_ms': round((elapsed - duration) * 1000, 2),
+        })
+        return stats
+
+
+class SequenceExecutor:
+    """Runs a SequencePlan by dispatching its prebuilt messages in order.
+
+    publish is the async publish_request(topic, payload) of the web
+    interface. on_event(name, data), if given, is called for step_started,
+    step_finished and aborted so the caller can forward progress to its UI.
+
+    A run is aborted by cancelling the task it runs in, after calling
+    request_stop(). Cancellation interrupts whatever the step is awaiting,
+    and the handler always sends the zero-velocity stop before re-raising.
+    The time from request_stop() to that stop being dispatched is recorded.
+    """
+
+    def __init__(self, publish, topic, scheduler, on_event=None, log=print):
+        self._publish = publish
+        self.topic = topic
+        self.scheduler = scheduler
+        self.on_event = on_event
+        self.log = log
+        self._started_at = 0.0
+        self._stop_requested = None
+        self.running = False
+        self.movement_mode = False  # Whether the robot was left in movement mode by the last run
+        self.activations_skipped = 0
+        self.current_step = 0
+        self.last_steps = []  # Scheduler stats of every move step of the current/last run
+        self.aborts = 0
+        self.last_stop_latency = None  # Seconds from request_stop() to the stop command being sent
+        self.last_stop_ack_latency = None  # ... to the robot acknowledging it
+
+    def _emit(self, name, **data):
+        if self.on_event is not None:
+            self.on_event(name, data)
+
+    def request_stop(self):
+        """Timestamp an abort; call right before cancelling the task (any thread)"""
+        self._stop_requested = time.perf_counter()
+
+    async def run(self, plan, movement_mode=False):
+        """Execute plan in the current task; re-raises CancelledError after the stop is sent.
+
+        movement_mode=True tells the executor the robot is known to be in
+        movement mode already, so the opening StopMove is skipped.
+        """
+        self._started_at = time.perf_counter()
+        self.running = True
+        self.movement_mode = movement_mode
+        self.current_step = 0
+        self.last_steps = []
+        try:
+            await self._run_steps(plan)
+        except asyncio.CancelledError:
+            self.log("\n⛔ SEQUENCE ABORTED BY USER")
+            await asyncio.shield(self._send_stop(plan))
+            raise
+        finally:
+            self.running = False
+
+    async def _send_stop(self, plan):
+        sent_at = time.perf_counter()
+        requested = self._stop_requested
+        if requested is None or requested < self._started_at:
+            requested = sent_at  # Cancelled without request_stop(), e.g. on disconnect
+        try:
+            await self._publish(self.topic, plan.stop_payload)
+            self.last_stop_ack_latency = time.perf_counter() - requested
+        except Exception as e:
+            self.last_stop_ack_latency = None
+            self.log(f"  ⚠️  Stop command failed: {e}")
+        self.aborts += 1
+        self.last_stop_latency = sent_at - requested
+        self.log(f"  Stop sent {self.last_stop_latency * 1000:.1f} ms after the abort request")
+        self._emit('aborted', step=self.current_step, total=plan.step_count,
+                   stop_latency=round(self.last_stop_latency, 4))
+
+    async def _run_steps(self, plan):
+        loop = asyncio.get_running_loop()
+        # Numbered like the submitted sequence, so merged steps don't renumber the rest
+        total = plan.step_count
+
+        # CRITICAL: StopMove activates movement mode, movement commands are ignored without it
+        if plan.activate and self.movement_mode:
+            self.activations_skipped += 1
+            self.log("✓ Already in movement mode - skipping StopMove")
+        elif plan.activate:
+            self.log("🔧 Activating movement mode (sending StopMove)...")
+            await self._publish(self.topic, plan.activate_payload)
+            await asyncio.sleep(ACTIVATION_DELAY)
+            self.movement_mode = True
+            self.log("✓ Movement mode activated")
+
+        for step in plan.steps:
+            number = step.index + 1
+            self.current_step = number
+            started = loop.time()
+            step_stats = None
+            self.log(f"\n[Step {number}/{total}] Action: {step.action}, Duration: {step.duration}s")
+            self._emit('step_started', step=number, total=total, action=step.action, duration=step.duration)
+
+            if step.action == 'move':
+                vx, vy, vz = step.velocity
+                self.log(f"  Moving: vx={vx:.2f}, vy={vy:.2f}, vz={vz:.2f}")
+                step_stats = await self.scheduler.run(
+                    lambda k: self._publish(self.topic, step.payload), step.duration)
+                step_stats['step'] = number  # Same dict: acknowledgements keep counting
+                self.last_steps.append(step_stats)
+                self.log(f"  ✓ Movement complete ({step_stats['sent']} commands sent, "
+                      f"{step_stats['actual_rate_hz']:.1f} Hz, "
+                      f"max timing error {step_stats['max_error_ms']:.1f} ms)")
+                if step.stop_after:
+                    self.log("  Stopping movement...")
+                    await self._publish(self.topic, plan.stop_payload)
+
+            elif step.action in PROFILE_ACTIONS:
+                self.log(f"  {step.action.capitalize()}: {len(step.payloads)} commands, "
+                         f"ending at vx={step.velocity[0]:.2f}, vy={step.velocity[1]:.2f}, vz={step.velocity[2]:.2f}")
+                last = len(step.payloads) - 1
+                step_stats = await self.scheduler.run(
+                    lambda k: self._publish(self.topic, step.payloads[min(k, last)]), step.duration)
+                step_stats['step'] = number
+                self.last_steps.append(step_stats)
+                self.log(f"  ✓ {step.action.capitalize()} complete ({step_stats['sent']} commands sent, "
+                         f"max timing error {step_stats['max_error_ms']:.1f} ms)")
+                if step.stop_after:
+                    self.log("  Stopping movement...")
+                    await self._publish(self.topic, plan.stop_payload)
+
+            elif step.action == 'command':
+                self.log(f"  Sending command: {step.command}")
+                try:
+                    await self._publish(self.topic, step.payload)
+                    self.log("  ✓ Command sent successfully")
+                except Exception as e:
+                    self.log(f"  ✗ Command failed: {e}")
+                self.movement_mode = step.payload == plan.activate_payload
+                await asyncio.sleep(step.duration)
+                if step.reactivate:
+                    self.log(f"  Re-activating movement mode after {step.command}...")
+                    try:
+                        await self._publish(self.topic, plan.activate_payload)
+                        await asyncio.sleep(REACTIVATION_DELAY)
+                        self.movement_mode = True
+                        self.log("  ✓ Movement mode re-activated")
+                    except Exception as e:
+                        self.log(f"  ⚠️  Failed to re-activate movement mode: {e}")
+
+            elif step.action == 'wait':
+                self.log(f"  Waiting {step.duration}s...")
+                await asyncio.sleep(step.duration)
+                self.log("  ✓ Wait complete")
+
+            self._emit('step_finished', step=number, total=total, action=step.action,
+                       elapsed=round(loop.time() - started, 3), scheduler=step_stats)
+
+    def stats(self):
+        return {
+            'current_step': self.current_step,
+            'aborts': self.aborts,
+            'activations_skipped': self.activations_skipped,
+            'last_stop_latency_ms': round(self.last_stop_latency * 1000, 2)
+            if self.last_stop_latency is not None else None,
+            'last_stop_ack_latency_ms': round(self.last_stop_ack_latency * 1000, 2)
+            if self.last_stop_ack_latency is not None else None,
+            'steps': self.last_steps,
+        }
+
+
+class SequenceJob:
+    """One submitted sequence and its lifecycle in a SequenceQueue"""
+
+    def __init__(self, job_id, plan, sequence_id=None):
+        self.id = job_id
+        self.plan = plan
+        self.sequence_id = sequence_id
+        self.state = 'queued'  # -> running -> completed / cancelled / failed
+        self.error = None
+        self.exception = None
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'sequence_id': self.sequence_id,
+            'state': self.state,
+            'steps': self.plan.step_count,
+            'estimated_duration': self.plan.estimated_duration,
+            'queued_at': self.queued_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+
+class SequenceQueue:
+    """Compiled plans waiting to run, drained back to back by one task on the asyncio loop.
+
+    Flask threads submit, cancel and reorder jobs; the worker picks the next
+    job as soon as the previous one ends, without a round trip to the UI.
+    When a job leaves the robot in movement mode, the next job starts
+    without its StopMove activation. After the queue has been empty the
+    robot state is unknown (a /command may have changed it), so the next
+    job activates movement mode again.
+
+    on_event(name, job) is called on the loop for started and finished.
+    """
+
+    def __init__(self, executor, on_event=None, history=20):
+        self.executor = executor
+        self.on_event = on_event
+        self._lock = threading.Lock()
+        self._jobs = []  # Queued jobs in run order
+        self._history = deque(maxlen=history)
+        self._next_id = 1
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._job_task = None
+        self.current = None
+        self.handoffs = 0  # Jobs started straight after the previous one
+
+    def start(self):
+        """Start the worker on the running loop (call from inside the loop)"""
+        self.stop()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    def stop(self):
+        """Cancel the worker and drop every queued job (loop thread, or after the loop stopped)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        with self._lock:
+            dropped, self._jobs = self._jobs, []
+        for job in dropped:
+            job.state = 'cancelled'
+            self._history.append(job)
+
+    async def shutdown(self, timeout=2.0):
+        """stop(), then wait until the running job has sent its zero-velocity stop (on the loop).
+
+        Use this before stopping the loop: a bare stop() only schedules the
+        cancellation, and a loop that stops right after never runs the job's
+        stop handler, leaving the robot on its last Move.
+        """
+        job, job_task, worker = self.current, self._job_task, self._task
+        self.stop()  # The cancelled worker cancels the job task in turn
+        tasks = [task for task in (worker, job_task) if task is not None and not task.done()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        if job is not None and job.state == 'running':
+            job.state = 'cancelled'
+            job.finished_at = time.time()
+            self._history.append(job)
+        self.current = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    @property
+    def busy(self):
+        return self.current is not None or len(self) > 0
+
+    def submit(self, plan, sequence_id=None):
+        """Append a plan (any thread); returns (job, position), position 0 = runs next"""
+        with self._lock:
+            job = SequenceJob(f"job-{self._next_id}", plan, sequence_id)
+            self._next_id += 1
+            self._jobs.append(job)
+            position = len(self._jobs) - 1
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job, position
+
+    def move(self, job_id, position):
+        """Move a queued job to position (0 = next); returns False if it is not queued"""
+        with self._lock:
+            for job in self._jobs:
+                if job.id == job_id:
+                    self._jobs.remove(job)
+                    self._jobs.insert(max(0, min(position, len(self._jobs))), job)
+                    return True
+        return False
+
+    def cancel(self, job_id):
+        """Cancel a queued or the running job (any thread); returns False if not found"""
+        with self._lock:
+            for job in self._jobs:
+                if job.id == job_id:
+                    self._jobs.remove(job)
+                    job.state = 'cancelled'
+                    job.finished_at = time.time()
+                    self._history.append(job)
+                    return True
+        current = self.current
+        if current is not None and current.id == job_id:
+            self._cancel_current(current)
+            return True
+        return False
+
+    def cancel_all(self):
+        """Drop every queued job and abort the running one; returns how many were affected"""
+        with self._lock:
+            dropped, self._jobs = self._jobs, []
+        for job in dropped:
+            job.state = 'cancelled'
+            job.finished_at = time.time()
+            self._history.append(job)
+        current = self.current
+        if current is not None:
+            self._cancel_current(current)
+            return len(dropped) + 1
+        return len(dropped)
+
+    def _cancel_current(self, job):
+        def cancel():
+            # On the loop; the job may have finished and the next one started meanwhile
+            if self.current is job and self._job_task is not None:
+                self._job_task.cancel()
+        self.executor.request_stop()
+        self._loop.call_soon_threadsafe(cancel)
+
+    def jobs(self):
+        with self._lock:
+            queued = [job.describe() for job in self._jobs]
+        current = self.current
+        return {
+            'current': current.describe() if current is not None else None,
+            'queued': queued,
+            'history': [job.describe() for job in reversed(self._history)],
+        }
+
+    def _emit(self, name, job):
+        if self.on_event is not None:
+            self.on_event(name, job)
+
+    async def _run(self):
+        continuing = False
+        while True:
+            with self._lock:
+                job = self._jobs.pop(0) if self._jobs else None
+                self.current = job
+            if job is None:
+                continuing = False  # Idle: the robot may be commanded outside the queue
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if continuing:
+                self.handoffs += 1
+            job.state = 'running'
+            job.started_at = time.time()
+            self._emit('started', job)
+            self._job_task = self._loop.create_task(
+                self.executor.run(job.plan, movement_mode=continuing and self.executor.movement_mode))
+            try:
+                await asyncio.wait({self._job_task})
+            except asyncio.CancelledError:
+                self._job_task.cancel()  # The worker itself is stopping
+                raise
+            if self._job_task.cancelled():
+                job.state = 'cancelled'
+            elif self._job_task.exception() is not None:
+                job.state = 'failed'
+                job.exception = self._job_task.exception()
+                job.error = str(job.exception)
+            else:
+                job.state = 'completed'
+            self._job_task = None
+            job.finished_at = time.time()
+            self._history.append(job)
+            with self._lock:
+                self.current = None
+            continuing = job.state == 'completed'
+            self._emit('finished', job)
+
+    def stats(self):
+        return {
+            'queued': len(self),
+            'handoffs': self.handoffs,
+            'activations_skipped': self.executor.activations_skipped,
+        }
+
+
+class SequenceLibrary:
+    """Named sequences kept in a JSON file, with their compiled plans cached in memory.
+
+    Sequences are validated when saved, but the file is shared by both web
+    interfaces, whose command lists differ, and may be edited by hand, so a
+    stored sequence can still fail to compile here. plan(id) compiles once
+    and then serves the cached SequencePlan until the sequence is replaced
+    or deleted. All methods are safe to call from concurrent Flask threads.
+    """
+
+    ID_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+    def __init__(self, path, compiler):
+        self.path = path
+        self.compiler = compiler
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._plans = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Could not load sequence library {self.path}: {e}")
+
+    def _write(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp, self.path)  # Never leave a half-written library behind
+
+    @classmethod
+    def make_id(cls, name):
+        """Slug for a sequence name; name must be a non-empty string"""
+        slug = re.sub(r'[^a-z0-9_-]+', '-', str(name).lower()).strip('-')[:64]
+        return slug or 'sequence'
+
+    def list(self):
+        with self._lock:
+            return [self._summary(sequence_id, entry) for sequence_id, entry in self._entries.items()]
+
+    def _summary(self, sequence_id, entry):
+        return {'id': sequence_id, 'name': entry['name'], 'steps': len(entry['sequence']),
+                'estimated_duration': entry['estimated_duration'], 'updated': entry['updated']}
+
+    def get(self, sequence_id):
+        """Return the stored entry; raises KeyError for unknown ids"""
+        with self._lock:
+            return dict(self._entries[sequence_id], id=sequence_id)
+
+    def save(self, sequence_id, name, sequence, replace=True):
+        """Validate and store a sequence under sequence_id; raises SequenceError.
+
+        With replace=False an existing id raises SequenceExistsError instead
+        of being overwritten.
+        """
+        if not isinstance(sequence_id, str) or not self.ID_PATTERN.match(sequence_id):
+            raise SequenceError([f"Invalid sequence id {sequence_id!r} (use a-z, 0-9, - and _)"])
+        plan = self.compiler.compile(sequence)
+        entry = {'name': name or sequence_id, 'sequence': sequence,
+                 'estimated_duration': plan.estimated_duration, 'updated': time.time()}
+        with self._lock:
+            if not replace and sequence_id in self._entries:
+                raise SequenceExistsError(sequence_id)
+            self._entries[sequence_id] = entry
+            self._plans[sequence_id] = plan
+            self._write()
+        return plan
+
+    def delete(self, sequence_id):
+        """Remove a sequence; raises KeyError for unknown ids"""
+        with self._lock:
+            del self._entries[sequence_id]
+            self._plans.pop(sequence_id, None)
+            self._write()
+
+    def plan(self, sequence_id):
+        """Return the compiled plan of a stored sequence; raises KeyError for unknown ids, SequenceError"""
+        with self._lock:
+            plan = self._plans.get(sequence_id)
+            if plan is not None:
+                self.cache_hits += 1
+                return plan
+            sequence = self._entries[sequence_id]['sequence']
+            self.cache_misses += 1
+            plan = self._plans[sequence_id] = self.compiler.compile(sequence)
+            return plan
+
+    def stats(self):
+        return {
+            'sequences': len(self._entries),
+            'cached_plans': len(self._plans),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+class _VirtualClockSelector(selectors.DefaultSelector):
+    """Selector that never blocks: a select() timeout advances the clock instead"""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("Simulation stalled: nothing left to wait for")
+        self.now += timeout
+        return super().select(0)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time jumps straight to the next timer.
+
+    asyncio.sleep(), loop.time() deadlines and call_later all behave as on a
+    real loop, but a 3-minute sequence completes in milliseconds.
+    """
+
+    def __init__(self):
+        self._clock = _VirtualClockSelector()
+        super().__init__(self._clock)
+
+    def time(self):
+        return self._clock.now
+
+
+class SimulatedDatachannel:
+    """Stand-in for publish_request: records every message and answers after latency seconds"""
+
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.messages = []
+
+    async def publish(self, topic, payload):
+        message = {'t': round(asyncio.get_running_loop().time(), 4), 'topic': topic,
+                   'api_id': payload.get('api_id')}
+        if 'parameter' in payload:
+            message['parameter'] = dict(payload['parameter'])
+        self.messages.append(message)
+        await asyncio.sleep(self.latency)
+        return {'data': {'header': {'status': {'code': 0}}}}
+
+
+def integrate_path(messages, end_time, stop_move_id, move_id=1008, sample_interval=0.1):
+    """Dead-reckon the robot pose from a message timeline.
+
+    Each Move holds its body-frame velocity (x forward, y left, z yaw rate)
+    until the next message; any other command stops the robot. Returns
+    (path samples, warnings for Moves sent outside movement mode).
+    """
+    x = y = yaw = 0.0
+    velocity = (0.0, 0.0, 0.0)
+    movement_mode = False
+    t = 0.0
+    path = [{'t': 0.0, 'x': 0.0, 'y': 0.0, 'yaw': 0.0}]
+    warnings = []
+
+    def advance(until):
+        nonlocal x, y, yaw, t
+        while t < until - 1e-9:
+            dt = min(sample_interval, until - t)
+            heading = yaw + velocity[2] * dt / 2
+            x += (velocity[0] * math.cos(heading) - velocity[1] * math.sin(heading)) * dt
+            y += (velocity[0] * math.sin(heading) + velocity[1] * math.cos(heading)) * dt
+            yaw += velocity[2] * dt
+            t += dt
+            path.append({'t': round(t, 4), 'x': round(x, 4), 'y': round(y, 4), 'yaw': round(yaw, 4)})
+
+    for message in messages:
+        advance(message['t'])
+        if message['api_id'] == move_id:
+            parameter = message.get('parameter', {})
+            velocity = (parameter.get('x', 0.0), parameter.get('y', 0.0), parameter.get('z', 0.0))
+            if any(velocity) and not movement_mode:
+                warnings.append(f"t={message['t']:.2f}s: Move sent outside movement mode (robot ignores it)")
+                velocity = (0.0, 0.0, 0.0)
+        else:
+            velocity = (0.0, 0.0, 0.0)
+            movement_mode = message['api_id'] == stop_move_id
+    advance(end_time)
+    return path, warnings
+
+
+def simulate_plan(plan, topic, rate_hz=10, latency=0.02, sample_interval=0.1):
+    """Run plan through SequenceExecutor on a virtual clock against a SimulatedDatachannel.
+
+    Returns the exact message timeline, per-step timing, the integrated pose
+    path and any problems found in the timeline (Moves the robot would
+    ignore). Takes milliseconds of wall time whatever the sequence length.
+    """
+    datachannel = SimulatedDatachannel(latency)
+    steps = []
+
+    def on_event(name, data):
+        if name == 'step_started':
+            steps.append({'step': data['step'], 'action': data['action'],
+                          'start': round(loop.time(), 4)})
+        elif name == 'step_finished':
+            steps[-1]['end'] = round(loop.time(), 4)
+
+    executor = SequenceExecutor(datachannel.publish, topic, DeadlineScheduler(rate_hz),
+                                on_event=on_event, log=lambda *args: None)
+    wall_started = time.perf_counter()
+    loop = VirtualClockLoop()
+    try:
+        loop.run_until_complete(executor.run(plan))
+        duration = loop.time()
+        pending = asyncio.all_tasks(loop)
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending))  # Outstanding acknowledgements
+    finally:
+        loop.close()
+
+    path, warnings = integrate_path(datachannel.messages, duration,
+                                    plan.activate_payload['api_id'], sample_interval=sample_interval)
+    final = path[-1]
+    return {
+        'duration': round(duration, 4),
+        'estimated_duration': plan.estimated_duration,
+        'messages': datachannel.messages,
+        'steps': steps,
+        'path': path,
+        'final_pose': {'x': final['x'], 'y': final['y'], 'yaw': final['yaw']},
+        'warnings': plan.warnings,
+        'problems': warnings,
+        'wall_time_ms': round((time.perf_counter() - wall_started) * 1000, 2),
+    }
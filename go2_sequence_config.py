@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Sequence and movement settings shared by the Go2 web interfaces
+Kept free of robot, web and video imports so simulate_sequences.py can
+validate sequences in CI with only go2_sequence's own dependencies
+"""
+
+# Sequence move steps repeat their Move command on fixed deadlines at this rate
+SEQUENCE_COMMAND_HZ = 10
+# Merge equal moves and drop stops/StopMove re-activations that no later step needs
+SEQUENCE_OPTIMIZE = True
+# Acceleration limits for ramp/curve steps (their velocity profiles are precomputed at SEQUENCE_COMMAND_HZ)
+SEQUENCE_LINEAR_ACCEL = 1.0  # m/s²
+SEQUENCE_ANGULAR_ACCEL = 2.0  # rad/s²
+# Longest accepted step and sequence; anything longer is rejected before the robot moves
+SEQUENCE_MAX_STEP_SECONDS = 60
+SEQUENCE_MAX_TOTAL_SECONDS = 600
+
+# Movement limits
+MAX_LINEAR_SPEED = 1.0  # m/s
+MAX_ANGULAR_SPEED = 1.5  # rad/s
+
+# Commands accepted in sequence 'command' steps, per interface
+BASE_SEQUENCE_COMMANDS = {
+    'stand': 'StandUp',
+    'sit': 'Sit',
+    'damp': 'Damp',
+    'stop': 'StopMove',
+    'hello': 'Hello',
+    'dance': 'Dance1'
+}
+
+ADVANCED_SEQUENCE_COMMANDS = {
+    'stand': 'StandUp',
+    'sit': 'Sit',
+    'damp': 'Damp',
+    'stop': 'StopMove',
+    'hello': 'Hello',
+    'stretch': 'Stretch',
+    'wigglehips': 'WiggleHips',
+    'fingerheart': 'FingerHeart',
+    'dance1': 'Dance1',
+    'dance2': 'Dance2',
+    'frontflip': 'FrontFlip',
+    'frontjump': 'FrontJump',
+    'wallow': 'Wallow',
+    # Legacy mappings
+    'dance': 'Dance1'
+}
+
+SEQUENCE_COMMANDS = {
+    'base': BASE_SEQUENCE_COMMANDS,
+    'advanced': ADVANCED_SEQUENCE_COMMANDS,
+}
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Video pipeline helpers shared by the Go2 web interfaces
+Latest-wins frame handoff between the WebRTC track and the MJPEG viewers
+"""
+
+import cv2
+import numpy as np
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Optional libjpeg-turbo bindings (pip install PyTurboJPEG) for YUV-native encoding
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+
+class FrameSlot:
+    """Holds only the newest frame, tagged with a sequence number.
+
+    The producer (recv_camera_stream) never blocks and never discards the
+    newest frame: publishing replaces whatever is in the slot. Consumers
+    remember the last sequence number they saw and wait on the condition
+    variable until a newer frame is published.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._epoch = 0
+        self._taken = True
+        self.published_at = 0.0
+        self.frames_published = 0
+        self.frames_superseded = 0  # Replaced before any consumer read them
+        self.frames_dropped = 0     # Skipped by a consumer that fell behind
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publish(self, frame):
+        """Store frame as the newest one and wake every waiting consumer"""
+        with self._cond:
+            if not self._taken:
+                self.frames_superseded += 1
+            self._frame = frame
+            self._seq += 1
+            self._taken = False
+            self.published_at = time.time()
+            self.frames_published += 1
+            self._cond.notify_all()
+
+    def get(self, last_seq=0, timeout=None):
+        """Return (seq, frame) for the newest frame after last_seq.
+
+        Blocks without polling; timeout=None waits until a frame arrives.
+        Returns (last_seq, None) if nothing newer arrived within timeout or
+        the slot was cleared while waiting.
+        """
+        with self._cond:
+            epoch = self._epoch
+            if not self._cond.wait_for(lambda: self._seq > last_seq or self._epoch != epoch, timeout):
+                return last_seq, None
+            if self._seq <= last_seq:
+                return last_seq, None
+            if last_seq:
+                self.frames_dropped += self._seq - last_seq - 1
+            self._taken = True
+            return self._seq, self._frame
+
+    def latest(self):
+        """Return (seq, frame, published_at) without waiting or touching the counters"""
+        with self._cond:
+            return self._seq, self._frame, self.published_at
+
+    def clear(self):
+        """Forget the stored frame (on disconnect) and wake all waiters; sequence keeps counting"""
+        with self._cond:
+            self._frame = None
+            self._taken = True
+            self._epoch += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'seq': self._seq,
+                'frames_published': self.frames_published,
+                'frames_superseded': self.frames_superseded,
+                'frames_dropped': self.frames_dropped,
+            }
+
+
+def encode_jpeg(frame, quality=80):
+    """Encode an av.VideoFrame (or an already decoded BGR ndarray) as JPEG bytes"""
+    if hasattr(frame, 'to_ndarray'):
+        frame = frame.to_ndarray(format="bgr24")
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ret else None
+
+
+class OpenCVJpegEncoder:
+    """Fallback encoder: YUV -> BGR in PyAV, then BGR -> YUV again inside cv2.imencode"""
+
+    name = 'opencv'
+
+    def encode(self, frame, quality=80):
+        return encode_jpeg(frame, quality)
+
+
+class TurboJpegYUVEncoder:
+    """Builds the JPEG straight from the decoded YUV420 planes with libjpeg-turbo.
+
+    The H.264 decoder already produces yuv420p, which is exactly what a
+    4:2:0 JPEG stores, so no colour conversion happens at all.
+    """
+
+    name = 'turbojpeg'
+
+    def __init__(self):
+        if TurboJPEG is None:
+            raise RuntimeError("PyTurboJPEG is not installed")
+        self._turbo = TurboJPEG()
+
+    def encode(self, frame, quality=80):
+        if not hasattr(frame, 'to_ndarray'):
+            return self._turbo.encode(frame, quality=quality)
+        if frame.format.name not in ('yuv420p', 'yuvj420p') or frame.width % 2 or frame.height % 2:
+            return self._turbo.encode(frame.to_ndarray(format="bgr24"), quality=quality)
+        # PyAV packs the Y, U and V planes into one contiguous I420 buffer
+        yuv = frame.to_ndarray()
+        return self._turbo.encode_from_yuv(yuv, frame.height, frame.width,
+                                           quality=quality, jpeg_subsample=TJSAMP_420)
+
+
+JPEG_BACKENDS = {
+    'turbojpeg': TurboJpegYUVEncoder,
+    'opencv': OpenCVJpegEncoder,
+}
+
+
+def create_jpeg_encoder(backend='auto'):
+    """Return a JPEG encoder; 'auto' prefers libjpeg-turbo and falls back to OpenCV"""
+    if backend != 'auto':
+        return JPEG_BACKENDS[backend]()
+    try:
+        return TurboJpegYUVEncoder()
+    except Exception as e:
+        print(f"⚠️  libjpeg-turbo not available ({e}), using OpenCV JPEG encoder")
+        return OpenCVJpegEncoder()
+
+
+class FrameBroadcaster:
+    """Decodes and encodes each frame once and fans the JPEG out to every viewer.
+
+    The asyncio loop only hands raw av.VideoFrames to the source slot. A
+    single worker thread takes the newest one, converts and encodes it off
+    the loop, and publishes the JPEG bytes into its own slot. Every subscriber keeps its
+    own sequence cursor into that slot, so a slow client just skips ahead
+    to the newest JPEG without holding back the others.
+
+    While nobody is subscribed, offer() drops incoming frames before they
+    reach the worker, so nothing is converted or encoded. aiortc has
+    already decoded every frame, so each one is a complete picture and the
+    first viewer to arrive gets the very next frame.
+    """
+
+    def __init__(self, source, quality=80, encoder=None):
+        self.source = source
+        self.quality = quality
+        self.encoder = encoder or create_jpeg_encoder()
+        self.jpeg_slot = FrameSlot()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._latest_raw = None
+        self._raw_seq = 0
+        self._snapshot_raw_seq = 0
+        self._snapshot_lock = threading.Lock()
+        self.subscribers = 0
+        self.frames_idle_skipped = 0
+        self.frames_encoded = 0
+        self.encode_errors = 0
+
+    def start(self):
+        """Start the encoder thread if it is not running yet"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    @property
+    def has_viewers(self):
+        return self.subscribers > 0
+
+    def offer(self, frame):
+        """Hand a frame from the track to the worker; returns False if it was skipped"""
+        # Keeping a reference is free and lets snapshot() encode on demand while idle
+        self._latest_raw = frame
+        self._raw_seq += 1
+        if not self.subscribers:
+            self.frames_idle_skipped += 1
+            return False
+        self.source.publish(frame)
+        return True
+
+    def _run(self):
+        last_seq = self.source.seq
+        while True:
+            # No timeout: the worker sleeps until a frame is published
+            last_seq, frame = self.source.get(last_seq)
+            if frame is None:
+                continue
+            try:
+                jpeg = self.encoder.encode(frame, self.quality)
+            except Exception as e:
+                print(f"JPEG encode error: {e}")
+                jpeg = None
+            if jpeg is not None:
+                self.jpeg_slot.publish(jpeg)
+                self.frames_encoded += 1
+            else:
+                self.encode_errors += 1
+
+    def subscribe(self, timeout=5):
+        """Yield JPEG bytes for one viewer, or None when nothing new arrived in time.
+
+        Viewers are woken by the publish itself; timeout is only a heartbeat
+        so generators of vanished clients eventually notice and exit.
+        """
+        self.start()
+        with self._lock:
+            self.subscribers += 1
+        try:
+            cursor = self.jpeg_slot.seq
+            while True:
+                cursor, jpeg = self.jpeg_slot.get(cursor, timeout)
+                yield jpeg
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+
+    def snapshot(self):
+        """Return (seq, published_at, jpeg) for the newest JPEG, or None if there is none.
+
+        With live viewers the worker keeps the JPEG fresh. While idle, the
+        newest raw frame is encoded here, at most once per frame.
+        """
+        with self._snapshot_lock:
+            raw = self._latest_raw
+            if not self.has_viewers and raw is not None and self._raw_seq != self._snapshot_raw_seq:
+                self._snapshot_raw_seq = self._raw_seq
+                try:
+                    jpeg = self.encoder.encode(raw, self.quality)
+                except Exception as e:
+                    print(f"JPEG encode error: {e}")
+                    jpeg = None
+                if jpeg is not None:
+                    self.jpeg_slot.publish(jpeg)
+                    self.frames_encoded += 1
+                else:
+                    self.encode_errors += 1
+            seq, jpeg, published_at = self.jpeg_slot.latest()
+            if jpeg is None:
+                return None
+            return seq, published_at, jpeg
+
+    def clear(self):
+        self._latest_raw = None
+        self.source.clear()
+        self.jpeg_slot.clear()
+
+    def stats(self):
+        stats = self.source.stats()
+        stats.update({
+            'frames_received': self._raw_seq,
+            'viewers': self.subscribers,
+            'frames_idle_skipped': self.frames_idle_skipped,
+            'jpeg_backend': self.encoder.name,
+            'frames_encoded': self.frames_encoded,
+            'encode_errors': self.encode_errors,
+            'viewer_frames_skipped': self.jpeg_slot.frames_dropped,
+        })
+        return stats
+
+
+Snapshot = namedtuple('Snapshot', ['seq', 'timestamp', 'jpeg', 'etag'])
+
+
+class SnapshotCache:
+    """Serves the most recent JPEG for /snapshot, plus an LRU of resized variants.
+
+    Variants are keyed by (frame seq, width), so a poll of an unchanged frame
+    never re-encodes, and a new frame naturally invalidates old variants.
+    ETags carry a startup epoch because frame seqs restart at 1 with the process.
+    """
+
+    def __init__(self, broadcaster, max_variants=8, quality=80):
+        self.broadcaster = broadcaster
+        self.max_variants = max_variants
+        self.quality = quality
+        self.epoch = format(time.time_ns(), 'x')
+        self._variants = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, width=None):
+        """Return a Snapshot for the newest frame (resized to width if given), or None"""
+        latest = self.broadcaster.snapshot()
+        if latest is None:
+            return None
+        seq, timestamp, jpeg = latest
+        if not width:
+            return Snapshot(seq, timestamp, jpeg, f"{self.epoch}-{seq}-full")
+
+        key = (seq, width)
+        with self._lock:
+            if key in self._variants:
+                self._variants.move_to_end(key)
+                self.hits += 1
+                return Snapshot(seq, timestamp, self._variants[key], f"{self.epoch}-{seq}-{width}")
+
+        resized = self._resize(jpeg, width)
+        with self._lock:
+            self.misses += 1
+            self._variants[key] = resized
+            while len(self._variants) > self.max_variants:
+                self._variants.popitem(last=False)
+        return Snapshot(seq, timestamp, resized, f"{self.epoch}-{seq}-{width}")
+
+    def _resize(self, jpeg, width):
+        img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None or width >= img.shape[1]:
+            return jpeg
+        height = max(1, round(img.shape[0] * width / img.shape[1]))
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer.tobytes() if ret else jpeg
+
+    def clear(self):
+        with self._lock:
+            self._variants.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'variants': len(self._variants),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -4,16 +4,18 @@ Unitree Go2 Web Interface - Enhanced with Joystick Control and Movement Sequence
 FIXED VERSION with extensive debugging and sequence monitoring
 """
 
-from flask import Flask, render_template, Response, jsonify, request
+from flask import Flask, render_template, Response, jsonify, request, g
 from flask_cors import CORS
 import cv2
 import asyncio
+import concurrent.futures
 import threading
 import time
-from queue import Queue
 import logging
 import json
+import math
 import os
+import websockets
 
 # Suppress OpenCV warnings
 os.environ['OPENCV_LOG_LEVEL'] = 'ERROR'
@@ -21,36 +23,152 @@ cv2.setLogLevel(0)
 
 from go2_webrtc_driver.webrtc_driver import Go2WebRTCConnection, WebRTCConnectionMethod
 from go2_webrtc_driver.constants import RTC_TOPIC, SPORT_CMD
-from aiortc import MediaStreamTrack
+from aiortc import MediaStreamTrack, RTCPeerConnection, RTCRtpSender, RTCSessionDescription
+from go2_video import FrameSlot, FrameBroadcaster, SnapshotCache, create_jpeg_encoder
+from go2_metrics import LoopLagMonitor, MetricsRegistry, PhaseTimer
+from go2_recorder import H264Relay, SegmentRecorder, install_packet_tap
+from go2_control import MotionModeSwitcher, VelocityCommandSlot, VelocityStreamer, VelocityFilter
+from go2_events import EventBus, format_sse
+from go2_sequence_config import (SEQUENCE_COMMAND_HZ, SEQUENCE_OPTIMIZE, SEQUENCE_LINEAR_ACCEL,
+                                 SEQUENCE_ANGULAR_ACCEL, SEQUENCE_MAX_STEP_SECONDS, SEQUENCE_MAX_TOTAL_SECONDS,
+                                 MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED, ADVANCED_SEQUENCE_COMMANDS)
+from go2_sequence import (DeadlineScheduler, SequenceCompiler, SequenceError, SequenceExecutor,
+                          SequenceExistsError, SequenceLibrary, SequenceQueue, simulate_plan)
 
 app = Flask(__name__)
 CORS(app)
 
 logging.basicConfig(level=logging.WARNING)
 
+# Metrics exposed at /metrics (Prometheus text format)
+metrics = MetricsRegistry()
+http_latency = metrics.histogram('go2_http_request_duration_seconds',
+                                 'Time from HTTP receipt to response', ('endpoint',))
+http_responses = metrics.counter('go2_http_responses_total',
+                                 'HTTP responses by endpoint and status code', ('endpoint', 'code'))
+rtc_latency = metrics.histogram('go2_rtc_request_duration_seconds',
+                                'publish_request_new round trip by RTC topic', ('topic',))
+rtc_responses = metrics.counter('go2_rtc_responses_total',
+                                'publish_request_new results by RTC topic and robot status code', ('topic', 'code'))
+future_timeouts = metrics.counter('go2_future_timeouts_total',
+                                  'HTTP handlers that timed out waiting on the asyncio loop', ('endpoint',))
+sequence_step_latency = metrics.histogram('go2_sequence_step_duration_seconds',
+                                          'Sequence step execution time by action', ('action',))
+sequence_stop_latency = metrics.histogram('go2_sequence_stop_latency_seconds',
+                                          'Time from /sequence/stop to the zero-velocity command being sent',
+                                          buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+loop_lag_histogram = metrics.histogram('go2_asyncio_loop_lag_seconds', 'asyncio loop wake-up lag',
+                                       buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
 # Global variables
 robot_connection = None
-frame_queue = Queue(maxsize=10)
+event_bus = EventBus()  # Server-Sent Events for /events
+frame_slot = FrameSlot()  # Latest raw av.VideoFrame only, newest always wins (fed via video_broadcaster.offer)
+loop_lag = LoopLagMonitor(histogram=loop_lag_histogram)  # How late the asyncio loop runs (delays movement commands)
+connect_timer = PhaseTimer()  # Where /connect spends its time (signalling, ICE, datachannel, ...)
 is_connected = False
 channels_ready = False
 asyncio_loop = None
 asyncio_thread = None
 movement_active = False
 current_velocity = {'x': 0.0, 'y': 0.0, 'z': 0.0}
-sequence_running = False
-sequence_abort = False
 joystick_mode_activated = False  # Track if joystick is ready
+webrtc_peers = set()
+joystick_server = None  # WebSocket joystick channel, lives on the asyncio loop
 
 ROBOT_IP = "192.168.12.1"
+CONNECT_TIMEOUT = 15  # Seconds /connect waits for WebRTC, datachannel, motion mode and video
+MOTION_MODE_TIMEOUT = 5  # Seconds to wait for the robot to confirm a switch to "normal"
+MOTION_MODE_CACHE_TTL = 60  # Reconnects within this many seconds trust the last confirmed mode
+
+# JPEG encoder for /video_feed: 'auto' (libjpeg-turbo if installed), 'turbojpeg' or 'opencv'
+JPEG_BACKEND = "auto"
+
+# WebSocket joystick channel (messages are compact JSON arrays: [vx, vy, vz])
+JOYSTICK_WS_PORT = 5001
+
+# Server-side velocity streaming: Move commands go out at a fixed rate set here,
+# independent of browser timers. 0 = send only on updates (latest-wins slot)
+VELOCITY_STREAM_HZ = 20
+VELOCITY_DEADMAN_MS = 500  # Ramp to zero if no joystick update arrives within this
+
+# Outbound velocity filter: snap to VELOCITY_RESOLUTION, skip changes smaller than
+# VELOCITY_CHANGE_THRESHOLD, but repeat the last command every VELOCITY_KEEPALIVE_MS
+VELOCITY_RESOLUTION = 0.01
+VELOCITY_CHANGE_THRESHOLD = 0.02
+VELOCITY_KEEPALIVE_MS = 200
+
+# Sequence rate, acceleration and movement limits live in go2_sequence_config
+SEQUENCE_LIBRARY_FILE = "sequences.json"  # Named sequences for /sequences and /sequence/<id>/execute
+
+# Passthrough H.264 recording (/record/start, /record/stop)
+RECORDING_DIR = "recordings"
+RECORDING_SEGMENT_SECONDS = 60
+RECORDING_BUDGET_MB = 2048  # Oldest segments are deleted beyond this
 
-# Movement limits
-MAX_LINEAR_SPEED = 1.0  # m/s
-MAX_ANGULAR_SPEED = 1.5  # rad/s
+# Commands accepted in sequence 'command' steps
+SEQUENCE_COMMANDS = ADVANCED_SEQUENCE_COMMANDS
+
+# Decode/encode once off the loop, fan out to all viewers
+video_broadcaster = FrameBroadcaster(frame_slot, quality=80, encoder=create_jpeg_encoder(JPEG_BACKEND))
+snapshot_cache = SnapshotCache(video_broadcaster)  # Last JPEG + resized variants for /snapshot
+video_recorder = SegmentRecorder(RECORDING_DIR, RECORDING_SEGMENT_SECONDS, RECORDING_BUDGET_MB)
+h264_relay = H264Relay()  # The robot's H.264 forwarded as-is to ?video=webrtc peers
+sequence_compiler = SequenceCompiler(SEQUENCE_COMMANDS, SPORT_CMD, MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED,
+                                     optimize=SEQUENCE_OPTIMIZE, rate_hz=SEQUENCE_COMMAND_HZ,
+                                     linear_accel=SEQUENCE_LINEAR_ACCEL, angular_accel=SEQUENCE_ANGULAR_ACCEL,
+                                     max_step_duration=SEQUENCE_MAX_STEP_SECONDS,
+                                     max_total_duration=SEQUENCE_MAX_TOTAL_SECONDS)
+sequence_library = SequenceLibrary(SEQUENCE_LIBRARY_FILE, sequence_compiler)
 
 @app.route('/')
 def index():
     return render_template('index_webinterface_advanced2.html')
 
+def publish_connection_state():
+    event_bus.publish('connection', {
+        'connected': is_connected,
+        'channels_ready': channels_ready
+    }, state=True)
+
+def publish_sequence_event(event, **data):
+    data.update({'event': event, 'running': sequence_queue.busy})
+    event_bus.publish('sequence', data, state=True)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_latency.labels(endpoint).observe(time.perf_counter() - started)
+        http_responses.labels(endpoint, response.status_code).inc()
+    return response
+
+async def publish_request(topic, payload):
+    """publish_request_new with round-trip latency and status code metrics per RTC topic"""
+    started = time.perf_counter()
+    try:
+        response = await robot_connection.datachannel.pub_sub.publish_request_new(topic, payload)
+    except Exception:
+        rtc_responses.labels(topic, 'error').inc()
+        raise
+    finally:
+        rtc_latency.labels(topic).observe(time.perf_counter() - started)
+    try:
+        code = response['data']['header']['status']['code']
+    except (KeyError, TypeError):
+        code = 'unknown'
+    rtc_responses.labels(topic, code).inc()
+    return response
+
+# Confirms the "normal" motion mode by polling instead of a fixed sleep, and caches it per robot IP
+motion_mode = MotionModeSwitcher(publish_request, RTC_TOPIC["MOTION_SWITCHER"],
+                                 timeout=MOTION_MODE_TIMEOUT, cache_ttl=MOTION_MODE_CACHE_TTL)
+
 @app.route('/connect', methods=['POST'])
 def connect():
     global robot_connection, is_connected, channels_ready, asyncio_loop, asyncio_thread
@@ -69,87 +187,109 @@ def connect():
             ip=ip
         )
         
-        # Async callback for video
+        # Async callback for video - conversion and encoding happen in the
+        # broadcaster's worker thread, never on the loop that sends commands
         async def recv_camera_stream(track: MediaStreamTrack):
+            # Encoded H.264 goes to the recorder and to browser WebRTC peers
+            # before aiortc decodes it; only MJPEG uses the decoded frames
+            def feed_encoded(data, timestamp):
+                video_recorder.feed(data, timestamp)
+                h264_relay.feed(data, timestamp)
+            h264_relay.available = install_packet_tap(getattr(robot_connection, 'pc', None), track, feed_encoded)
             while True:
                 try:
+                    # Always drain the track so the jitter buffer stays healthy;
+                    # with no /video_feed viewers the frame is dropped right here
                     frame = await track.recv()
-                    img = frame.to_ndarray(format="bgr24")
-                    if not frame_queue.full():
-                        frame_queue.put(img)
+                    connect_timer.note('first_video_frame')
+                    video_broadcaster.offer(frame)
                 except Exception as e:
                     print(f"Video stream error: {e}")
                     break
         
-        # Enhanced setup with channel waiting
+        def watch_peer_connection(pc):
+            """Mark the signalling and ICE phases from the peer connection's own state events"""
+            @pc.on("signalingstatechange")
+            def on_signalingstatechange():
+                if pc.signalingState == "stable" and 'signalling' not in connect_timer.phases:
+                    connect_timer.mark('signalling')  # Answer applied: offer/answer exchange done
+            
+            @pc.on("iceconnectionstatechange")
+            def on_iceconnectionstatechange():
+                if pc.iceConnectionState in ("connected", "completed") and \
+                        'signalling' in connect_timer.phases and 'ice' not in connect_timer.phases:
+                    connect_timer.mark('ice')
+        
+        # Setup runs as one task on the loop; /connect waits on its future, so
+        # it returns the moment the channels are ready instead of on a poll tick
         async def setup():
             global channels_ready
+            loop_lag.start()
+            connect_timer.reset()
             try:
                 # Connect to robot
                 print("Establishing WebRTC connection...")
-                await robot_connection.connect()
+                connect_task = asyncio.ensure_future(robot_connection.connect())
+                await asyncio.sleep(0)  # Let connect() create its RTCPeerConnection
+                pc = getattr(robot_connection, 'pc', None)
+                if pc is not None:
+                    watch_peer_connection(pc)
+                await connect_task
                 print("✓ WebRTC connection established")
                 
                 # Wait for data channel to be ready
-                print("Waiting for data channel...")
-                max_wait = 10  # seconds
-                wait_time = 0
-                while wait_time < max_wait:
-                    if hasattr(robot_connection, 'datachannel') and robot_connection.datachannel:
-                        if hasattr(robot_connection.datachannel, 'pub_sub'):
-                            print("✓ Data channel ready!")
-                            break
-                    await asyncio.sleep(0.5)
-                    wait_time += 0.5
-                
-                if wait_time >= max_wait:
-                    raise Exception("Data channel did not initialize in time")
+                datachannel = getattr(robot_connection, 'datachannel', None)
+                if datachannel is None or not hasattr(datachannel, 'pub_sub'):
+                    raise Exception("Data channel did not initialize")
+                channel = getattr(datachannel, 'channel', None)
+                if channel is not None and channel.readyState != "open":
+                    print("Waiting for data channel...")
+                    opened = asyncio.Event()
+                    channel.once("open", opened.set)
+                    try:
+                        await asyncio.wait_for(opened.wait(), timeout=10)
+                    except asyncio.TimeoutError:
+                        raise Exception("Data channel did not open in time")
+                # Without the peer connection events the three phases are one
+                connect_timer.mark('datachannel' if 'ice' in connect_timer.phases else 'webrtc')
+                print("✓ Data channel ready!")
                 
                 # IMPORTANT: Check and set motion mode to "normal"
                 print("Checking motion mode...")
                 try:
-                    response = await robot_connection.datachannel.pub_sub.publish_request_new(
-                        RTC_TOPIC["MOTION_SWITCHER"], 
-                        {"api_id": 1001}
-                    )
-                    
-                    print(f"Motion mode response: {response}")
-                    
-                    if response['data']['header']['status']['code'] == 0:
-                        data = json.loads(response['data']['data'])
-                        current_mode = data['name']
-                        print(f"Current motion mode: {current_mode}")
-                        
-                        if current_mode != "normal":
-                            print(f"Switching from '{current_mode}' to 'normal' mode...")
-                            switch_response = await robot_connection.datachannel.pub_sub.publish_request_new(
-                                RTC_TOPIC["MOTION_SWITCHER"], 
-                                {
-                                    "api_id": 1002,
-                                    "parameter": {"name": "normal"}
-                                }
-                            )
-                            print(f"Mode switch response: {switch_response}")
-                            await asyncio.sleep(3)  # Wait longer for mode switch
-                            print("✓ Switched to normal mode")
-                        else:
-                            print("✓ Already in normal mode")
+                    result = await motion_mode.ensure("normal", key=ip)
+                    if result['cached']:
+                        print("✓ Normal mode (cached, query skipped)")
+                    elif not result['switched']:
+                        print("✓ Already in normal mode")
+                    elif result['confirmed']:
+                        print(f"✓ Switched to normal mode ({result['switch_ms']:.0f} ms, {result['polls']} polls)")
                     else:
-                        print(f"⚠️  Motion mode check returned error code: {response['data']['header']['status']['code']}")
+                        print(f"⚠️  Mode switch not confirmed after {MOTION_MODE_TIMEOUT}s (robot reports '{result['mode']}')")
                 except Exception as e:
                     print(f"⚠️  Could not set motion mode: {e}")
+                    motion_mode.invalidate()
                     import traceback
                     traceback.print_exc()
                     print("Continuing anyway...")
+                connect_timer.mark('motion_mode')
+                
+                # Joystick WebSocket runs on this loop, next to the datachannel
+                velocity_slot.start()
+                sequence_queue.start()
+                await start_joystick_server()
+                connect_timer.mark('services')
                 
                 # Start video
                 print("Starting video stream...")
                 robot_connection.video.switchVideoChannel(True)
                 robot_connection.video.add_track_callback(recv_camera_stream)
                 print("✓ Video stream started")
+                connect_timer.mark('video')
                 
                 channels_ready = True
                 print("✓ All channels ready!")
+                return connect_timer.stats()
                 
             except Exception as e:
                 print(f"Setup error: {e}")
@@ -160,7 +300,6 @@ def connect():
         def run_asyncio_loop(loop):
             asyncio.set_event_loop(loop)
             try:
-                loop.run_until_complete(setup())
                 loop.run_forever()
             except Exception as e:
                 print(f"Asyncio loop error: {e}")
@@ -172,27 +311,49 @@ def connect():
         
         # Wait for channels to be ready
         print("Waiting for initialization...")
-        for i in range(15):  # Wait up to 15 seconds
-            if channels_ready:
-                break
-            time.sleep(1)
-            print(f"Waiting... {i+1}s")
-        
-        if not channels_ready:
-            raise Exception("Failed to initialize channels")
+        ready = asyncio.run_coroutine_threadsafe(setup(), asyncio_loop)
+        try:
+            timings = ready.result(timeout=CONNECT_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future_timeouts.labels('/connect').inc()
+            ready.cancel()
+            raise Exception(f"Failed to initialize channels within {CONNECT_TIMEOUT}s")
         
         is_connected = True
-        print("✓ Connection complete and ready!")
+        print(f"✓ Connection complete and ready! ({timings['total_ms']:.0f} ms: "
+              + ", ".join(f"{name} {ms:.0f}" for name, ms in timings['phases_ms'].items()) + ")")
+        publish_connection_state()
         
         return jsonify({
             'status': 'connected', 
-            'message': 'Successfully connected to robot and channels ready'
+            'message': 'Successfully connected to robot and channels ready',
+            'joystick_ws_port': JOYSTICK_WS_PORT if joystick_server else None,
+            'timings': timings
         })
     
     except Exception as e:
         is_connected = False
         channels_ready = False
+        if asyncio_loop:
+            # Setup may have got as far as the joystick port and the robot peer
+            # connection; release them on their own loop before stopping it
+            async def cleanup():
+                await stop_joystick_server()
+                velocity_slot.stop()
+                sequence_queue.stop()
+                if robot_connection is not None:
+                    await robot_connection.disconnect()
+            try:
+                asyncio.run_coroutine_threadsafe(cleanup(), asyncio_loop).result(timeout=3)
+            except Exception as cleanup_error:
+                print(f"⚠️  Cleanup after failed connect: {cleanup_error}")
+            asyncio_loop.call_soon_threadsafe(asyncio_loop.stop)
+            asyncio_thread.join(timeout=2)
+            robot_connection = None
+            asyncio_loop = None
+            asyncio_thread = None
         print(f"Connection failed: {e}")
+        publish_connection_state()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/disconnect', methods=['POST'])
@@ -205,6 +366,30 @@ def disconnect():
         movement_active = False
         joystick_mode_activated = False  # Reset joystick flag
         
+        if asyncio_loop:
+            # Waits for a running sequence to send its zero-velocity stop while the loop still runs
+            try:
+                asyncio.run_coroutine_threadsafe(sequence_queue.shutdown(), asyncio_loop).result(timeout=3)
+            except Exception as e:
+                print(f"⚠️  Could not stop the sequence queue: {e}")
+        
+        if asyncio_loop:
+            async def close_peers():
+                await asyncio.gather(*[pc.close() for pc in list(webrtc_peers)], return_exceptions=True)
+                webrtc_peers.clear()
+                h264_relay.reset()  # Its tracks' queues belong to this loop
+            try:
+                asyncio.run_coroutine_threadsafe(close_peers(), asyncio_loop).result(timeout=2)
+            except Exception as e:
+                print(f"⚠️  Could not close browser WebRTC peers: {e}")
+        video_recorder.stop()
+        
+        if asyncio_loop and joystick_server:
+            try:
+                asyncio.run_coroutine_threadsafe(stop_joystick_server(), asyncio_loop).result(timeout=2)
+            except Exception as e:
+                print(f"⚠️  Could not close joystick WebSocket: {e}")
+        
         if asyncio_loop:
             asyncio_loop.call_soon_threadsafe(asyncio_loop.stop)
         
@@ -215,10 +400,11 @@ def disconnect():
         asyncio_loop = None
         asyncio_thread = None
         
-        while not frame_queue.empty():
-            frame_queue.get()
+        video_broadcaster.clear()
+        snapshot_cache.clear()
         
         print("Disconnected from robot")
+        publish_connection_state()
         return jsonify({'status': 'disconnected', 'message': 'Disconnected from robot'})
     
     except Exception as e:
@@ -232,7 +418,14 @@ def status():
         'channels_ready': channels_ready,
         'ip': ROBOT_IP,
         'movement_active': movement_active,
-        'velocity': current_velocity
+        'velocity': current_velocity,
+        'video': video_broadcaster.stats(),
+        'loop_lag': loop_lag.stats(),
+        'recording': video_recorder.stats(),
+        'webrtc_video': h264_relay.stats(),
+        'commands': velocity_slot.stats(),
+        'connect': connect_timer.stats(),
+        'motion_mode': motion_mode.stats()
     })
 
 @app.route('/command', methods=['POST'])
@@ -294,7 +487,7 @@ def execute_command():
             global joystick_mode_activated
             try:
                 print(f"Sending sport command API ID: {SPORT_CMD[sport_cmd]}")
-                response = await robot_connection.datachannel.pub_sub.publish_request_new(
+                response = await publish_request(
                     RTC_TOPIC["SPORT_MOD"],
                     {"api_id": SPORT_CMD[sport_cmd]}
                 )
@@ -308,7 +501,7 @@ def execute_command():
                     
                     # Send small movements to activate gait
                     for _ in range(5):
-                        await robot_connection.datachannel.pub_sub.publish_request_new(
+                        await publish_request(
                             RTC_TOPIC["SPORT_MOD"],
                             {
                                 "api_id": 1008,
@@ -318,7 +511,7 @@ def execute_command():
                         await asyncio.sleep(0.1)
                     
                     # Stop but keep gait active
-                    await robot_connection.datachannel.pub_sub.publish_request_new(
+                    await publish_request(
                         RTC_TOPIC["SPORT_MOD"],
                         {
                             "api_id": 1008,
@@ -338,16 +531,169 @@ def execute_command():
         return jsonify({'status': 'success', 'command': command})
     
     except Exception as e:
+        if isinstance(e, concurrent.futures.TimeoutError):
+            future_timeouts.labels('/command').inc()
         print(f"Command error: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def set_target_velocity(vx, vy, vz):
+    """Clamp a joystick velocity to the movement limits and make it the current one"""
+    global current_velocity, movement_active
+    
+    vx = max(-MAX_LINEAR_SPEED, min(MAX_LINEAR_SPEED, vx))
+    vy = max(-MAX_LINEAR_SPEED, min(MAX_LINEAR_SPEED, vy))
+    vz = max(-MAX_ANGULAR_SPEED, min(MAX_ANGULAR_SPEED, vz))
+    
+    previous_velocity = current_velocity
+    current_velocity = {'x': vx, 'y': vy, 'z': vz}
+    movement_active = (abs(vx) > 0.01 or abs(vy) > 0.01 or abs(vz) > 0.01)
+    
+    # Only push real changes; a steady joystick stays silent on /events
+    if any(abs(current_velocity[k] - previous_velocity[k]) >= 0.01 for k in current_velocity):
+        event_bus.publish('velocity', dict(current_velocity, movement_active=movement_active), state=True)
+    return vx, vy, vz
+
+def record_sequence_event(name, data):
+    """SequenceExecutor progress -> /events and the step duration histogram"""
+    if name == 'step_finished':
+        sequence_step_latency.labels(data['action']).observe(data['elapsed'])
+    elif name == 'aborted':
+        sequence_stop_latency.observe(data['stop_latency'])
+    publish_sequence_event(name, **data)
+
+sequence_executor = SequenceExecutor(publish_request, RTC_TOPIC["SPORT_MOD"],
+                                     DeadlineScheduler(rate_hz=SEQUENCE_COMMAND_HZ),
+                                     on_event=record_sequence_event)
+
+def sequence_job_event(name, job):
+    """SequenceQueue job start/end -> console and /events (runs on the asyncio loop)"""
+    total = len(job.plan)
+    if name == 'started':
+        print(f"\n{'='*60}")
+        print(f"SEQUENCE EXECUTION STARTED - {job.id}, {total} steps, ~{job.plan.estimated_duration:.1f}s")
+        print(f"{'='*60}")
+        publish_sequence_event('started', job=job.id, total=total,
+                               estimated_duration=job.plan.estimated_duration, sequence_id=job.sequence_id)
+        return
+    
+    if job.state == 'completed':
+        print(f"\n{'='*60}")
+        print("✓ SEQUENCE COMPLETED SUCCESSFULLY")
+        print(f"{'='*60}\n")
+        publish_sequence_event('completed', job=job.id, total=total)
+    elif job.state == 'failed':
+        print(f"\n{'='*60}")
+        print(f"✗ SEQUENCE EXECUTION ERROR: {job.error}")
+        print(f"{'='*60}\n")
+        publish_sequence_event('error', job=job.id, message=job.error)
+        import traceback
+        traceback.print_exception(type(job.exception), job.exception, job.exception.__traceback__)
+    print(f"Sequence {job.id} {job.state} ({len(sequence_queue)} queued)\n")
+    publish_sequence_event('finished', job=job.id, state=job.state, queued=len(sequence_queue))
+
+# Sequences run back to back from here; /sequence/execute appends instead of rejecting
+sequence_queue = SequenceQueue(sequence_executor, on_event=sequence_job_event)
+
+async def send_velocity(vx, vy, vz):
+    """Publish one Move (api_id 1008) on the asyncio loop"""
+    payload = {
+        "api_id": 1008,
+        "parameter": {
+            "x": vx,
+            "y": vy,
+            "z": vz
+        }
+    }
+    response = await publish_request(
+        RTC_TOPIC["SPORT_MOD"],
+        payload
+    )
+    # Debug: Log response code
+    response_code = response['data']['header']['status']['code']
+    if response_code != 0:
+        print(f"⚠️ Robot response code: {response_code}")
+    return response
+
+# Joystick velocity commander, drained on the asyncio loop
+velocity_filter = VelocityFilter(VELOCITY_RESOLUTION, VELOCITY_CHANGE_THRESHOLD, VELOCITY_KEEPALIVE_MS)
+if VELOCITY_STREAM_HZ:
+    velocity_slot = VelocityStreamer(send_velocity, rate_hz=VELOCITY_STREAM_HZ,
+                                     deadman_ms=VELOCITY_DEADMAN_MS,
+                                     command_filter=velocity_filter)
+else:
+    # Latest-wins, sends only on updates
+    velocity_slot = VelocityCommandSlot(send_velocity, command_filter=velocity_filter)
+
+# Scrape-time views of counters the video and command paths already keep
+VIDEO_FRAME_STAGES = ('frames_received', 'frames_idle_skipped', 'frames_superseded',
+                      'frames_encoded', 'encode_errors', 'viewer_frames_skipped')
+metrics.gauge_callback('go2_video_frames_total', 'Video frames by pipeline stage',
+                       lambda: {(stage,): video_broadcaster.stats()[stage] for stage in VIDEO_FRAME_STAGES},
+                       ('stage',), type='counter')
+metrics.gauge_callback('go2_video_viewers', 'Attached /video_feed viewers', lambda: video_broadcaster.subscribers)
+metrics.gauge_callback('go2_webrtc_peers', 'Browser WebRTC video peers', lambda: len(webrtc_peers))
+metrics.gauge_callback('go2_velocity_commands_total', 'Joystick velocity commands by outcome',
+                       lambda: {('updates',): velocity_slot.updates, ('sent',): velocity_slot.sent,
+                                ('errors',): velocity_slot.errors,
+                                ('suppressed',): velocity_filter.suppressed},
+                       ('outcome',), type='counter')
+metrics.gauge_callback('go2_connected', 'Robot connected and channels ready',
+                       lambda: int(is_connected and channels_ready))
+
+async def joystick_socket(websocket):
+    """Persistent joystick channel: each message is [vx, vy, vz], handled right on the loop"""
+    print("🕹️ Joystick WebSocket connected")
+    try:
+        async for message in websocket:
+            if not is_connected or not channels_ready:
+                continue
+            try:
+                vx, vy, vz = (float(v) for v in json.loads(message))
+                # json.loads accepts NaN/Infinity, and NaN would clamp to full speed
+                if not all(math.isfinite(v) for v in (vx, vy, vz)):
+                    raise ValueError("non-finite velocity")
+            except (ValueError, TypeError):
+                print(f"⚠️ Bad joystick message: {message!r}")
+                continue
+            if sequence_queue.busy:
+                continue  # A running sequence owns the Move stream
+            
+            vx, vy, vz = set_target_velocity(vx, vy, vz)
+            
+            # Zero: the on-demand slot skips it (keeps the walking gait),
+            # the streamer sends a single final zero right away
+            if not movement_active:
+                velocity_slot.discard()
+                continue
+            velocity_slot.put(vx, vy, vz)
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        print("🕹️ Joystick WebSocket disconnected")
+
+async def start_joystick_server():
+    global joystick_server
+    try:
+        joystick_server = await websockets.serve(joystick_socket, '0.0.0.0', JOYSTICK_WS_PORT)
+        print(f"✓ Joystick WebSocket listening on port {JOYSTICK_WS_PORT}")
+    except Exception as e:
+        joystick_server = None
+        print(f"⚠️  Joystick WebSocket unavailable ({e}), HTTP /update_velocity still works")
+
+async def stop_joystick_server():
+    global joystick_server
+    if joystick_server:
+        joystick_server.close()
+        await joystick_server.wait_closed()
+        joystick_server = None
+
 @app.route('/move', methods=['POST'])
 @app.route('/update_velocity', methods=['POST'])  # HTML calls this one!
 def move():
     """Control robot movement with velocity commands"""
-    global robot_connection, asyncio_loop, current_velocity, movement_active
+    global robot_connection, asyncio_loop
     
     if not is_connected or not channels_ready:
         return jsonify({
@@ -362,58 +708,38 @@ def move():
         }), 400
     
     data = request.json
-    vx = float(data.get('vx', 0.0))  # Forward/backward (m/s)
-    vy = float(data.get('vy', 0.0))  # Left/right strafe (m/s)
-    vz = float(data.get('vz', 0.0))  # Rotation (rad/s)
+    try:
+        vx = float(data.get('vx', 0.0))  # Forward/backward (m/s)
+        vy = float(data.get('vy', 0.0))  # Left/right strafe (m/s)
+        vz = float(data.get('vz', 0.0))  # Rotation (rad/s)
+    except (ValueError, TypeError):
+        return jsonify({'status': 'error', 'message': 'vx, vy and vz must be numbers'}), 400
+    if not all(math.isfinite(v) for v in (vx, vy, vz)):
+        return jsonify({'status': 'error', 'message': 'vx, vy and vz must be finite'}), 400
+    if sequence_queue.busy:
+        # A running sequence owns the Move stream; joystick input would interleave with it
+        return jsonify({'status': 'success', 'velocity': current_velocity, 'skipped': 'sequence_running'})
     
     # Apply limits
-    vx = max(-MAX_LINEAR_SPEED, min(MAX_LINEAR_SPEED, vx))
-    vy = max(-MAX_LINEAR_SPEED, min(MAX_LINEAR_SPEED, vy))
-    vz = max(-MAX_ANGULAR_SPEED, min(MAX_ANGULAR_SPEED, vz))
+    vx, vy, vz = set_target_velocity(vx, vy, vz)
     
-    current_velocity = {'x': vx, 'y': vy, 'z': vz}
-    movement_active = (abs(vx) > 0.01 or abs(vy) > 0.01 or abs(vz) > 0.01)
-    
-    # Debug: Log joystick input
-    if movement_active:
-        print(f"🕹️ Joystick: vx={vx:.2f}, vy={vy:.2f}, vz={vz:.2f}")
-    
-    # IMPORTANT: Only send commands when joystick is actually moved
-    # Sending zero commands deactivates the walking gait!
-    if not movement_active:
-        return jsonify({
-            'status': 'success',
-            'velocity': current_velocity,
-            'skipped': 'zero_command'
-        })
+    # Debug logging happens in the command path, only when the sent velocity changes
     
     try:
-        async def send_movement():
-            try:
-                # Just send the movement command
-                payload = {
-                    "api_id": 1008,
-                    "parameter": {
-                        "x": vx,
-                        "y": vy,
-                        "z": vz
-                    }
-                }
-                response = await robot_connection.datachannel.pub_sub.publish_request_new(
-                    RTC_TOPIC["SPORT_MOD"],
-                    payload
-                )
-                # Debug: Log response code
-                if movement_active:
-                    response_code = response['data']['header']['status']['code']
-                    if response_code != 0:
-                        print(f"⚠️ Robot response code: {response_code}")
-            except Exception as e:
-                print(f"Movement send error: {e}")
-                raise
+        # IMPORTANT: Only send commands when joystick is actually moved
+        # Sending zero commands deactivates the walking gait!
+        # (In streaming mode this sets a zero target and feeds the deadman)
+        if not movement_active:
+            velocity_slot.discard_threadsafe()
+            return jsonify({
+                'status': 'success',
+                'velocity': current_velocity,
+                'skipped': 'zero_command'
+            })
         
-        future = asyncio.run_coroutine_threadsafe(send_movement(), asyncio_loop)
-        future.result(timeout=1)
+        # Latest-wins: the publisher task sends the newest velocity once the
+        # previous send completes, so this handler never waits on the robot
+        velocity_slot.put_threadsafe(vx, vy, vz)
         
         return jsonify({
             'status': 'success',
@@ -424,268 +750,370 @@ def move():
         print(f"Movement error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-@app.route('/sequence/execute', methods=['POST'])
-def execute_sequence():
-    """Execute a sequence of movements"""
-    global robot_connection, asyncio_loop, sequence_running, sequence_abort
-    
+def start_sequence(plan, sequence_id=None):
+    """Queue a compiled plan and build the HTTP response; it runs once the jobs ahead of it finish"""
     if not is_connected or not channels_ready:
         return jsonify({
             'status': 'error', 
             'message': 'Not connected or channels not ready'
         }), 400
     
-    if sequence_running:
-        return jsonify({
-            'status': 'error',
-            'message': 'Sequence already running. Use stop endpoint first.'
-        }), 400
-    
-    data = request.json
-    sequence = data.get('sequence', [])
-    
-    if not sequence:
-        return jsonify({'status': 'error', 'message': 'Empty sequence'}), 400
-    
-    print(f"\n{'='*60}")
-    print(f"SEQUENCE EXECUTION STARTED - {len(sequence)} steps")
-    print(f"{'='*60}")
-    
     try:
-        sequence_running = True
-        sequence_abort = False
-        
-        async def run_sequence():
-            global sequence_running, sequence_abort
-            try:
-                print("▶️  Starting sequence execution in async loop...")
-                
-                # CRITICAL: Send StopMove command to activate movement mode
-                # This is essential for movement commands to work
-                print("🔧 Activating movement mode (sending StopMove)...")
-                await robot_connection.datachannel.pub_sub.publish_request_new(
-                    RTC_TOPIC["SPORT_MOD"],
-                    {"api_id": SPORT_CMD["StopMove"]}
-                )
-                await asyncio.sleep(0.5)  # Wait for mode activation
-                print("✓ Movement mode activated")
-                
-                for i, step in enumerate(sequence):
-                    if sequence_abort:
-                        print("\n⛔ SEQUENCE ABORTED BY USER")
-                        await robot_connection.datachannel.pub_sub.publish_request_new(
-                            RTC_TOPIC["SPORT_MOD"],
-                            {
-                                "api_id": 1008,
-                                "parameter": {"x": 0.0, "y": 0.0, "z": 0.0}
-                            }
-                        )
-                        break
-                    
-                    action = step.get('action')
-                    duration = step.get('duration', 1.0)
-                    
-                    print(f"\n[Step {i+1}/{len(sequence)}] Action: {action}, Duration: {duration}s")
-                    
-                    if action == 'move':
-                        vx = float(step.get('vx', 0.0))
-                        vy = float(step.get('vy', 0.0))
-                        vz = float(step.get('vz', 0.0))
-                        
-                        vx = max(-MAX_LINEAR_SPEED, min(MAX_LINEAR_SPEED, vx))
-                        vy = max(-MAX_LINEAR_SPEED, min(MAX_LINEAR_SPEED, vy))
-                        vz = max(-MAX_ANGULAR_SPEED, min(MAX_ANGULAR_SPEED, vz))
-                        
-                        print(f"  Moving: vx={vx:.2f}, vy={vy:.2f}, vz={vz:.2f}")
-                        
-                        end_time = time.time() + duration
-                        iteration = 0
-                        while time.time() < end_time:
-                            if sequence_abort:
-                                break
-                            
-                            try:
-                                payload = {
-                                    "api_id": 1008,
-                                    "parameter": {
-                                        "x": vx,
-                                        "y": vy,
-                                        "z": vz
-                                    }
-                                }
-                                if iteration == 0:  # Log first command details
-                                    print(f"    First movement payload: {payload}")
-                                
-                                response = await robot_connection.datachannel.pub_sub.publish_request_new(
-                                    RTC_TOPIC["SPORT_MOD"],
-                                    payload
-                                )
-                                
-                                if iteration == 0:  # Log first response
-                                    print(f"    First movement response: {response}")
-                                
-                                iteration += 1
-                                if iteration % 10 == 0:
-                                    print(f"    ...movement command sent ({iteration} iterations)")
-                            except Exception as e:
-                                print(f"  ⚠️  Movement command failed: {e}")
-                                import traceback
-                                traceback.print_exc()
-                            
-                            await asyncio.sleep(0.1)
-                        
-                        print(f"  ✓ Movement complete ({iteration} commands sent)")
-                        
-                        print("  Stopping movement...")
-                        await robot_connection.datachannel.pub_sub.publish_request_new(
-                            RTC_TOPIC["SPORT_MOD"],
-                            {
-                                "api_id": 1008,
-                                "parameter": {"x": 0.0, "y": 0.0, "z": 0.0}
-                            }
-                        )
-                    
-                    elif action == 'command':
-                        command = step.get('command')
-                        command_mapping = {
-                            'stand': 'StandUp',
-                            'sit': 'Sit',
-                            'damp': 'Damp',
-                            'stop': 'StopMove',
-                            'hello': 'Hello',
-                            'stretch': 'Stretch',
-                            'wigglehips': 'WiggleHips',
-                            'fingerheart': 'FingerHeart',
-                            'dance1': 'Dance1',
-                            'dance2': 'Dance2',
-                            'frontflip': 'FrontFlip',
-                            'frontjump': 'FrontJump',
-                            'wallow': 'Wallow',
-                            # Legacy mappings
-                            'dance': 'Dance1'
-                        }
-                        
-                        sport_cmd = command_mapping.get(command)
-                        if sport_cmd and sport_cmd in SPORT_CMD:
-                            print(f"  Sending command: {command} ({sport_cmd})")
-                            try:
-                                await robot_connection.datachannel.pub_sub.publish_request_new(
-                                    RTC_TOPIC["SPORT_MOD"],
-                                    {"api_id": SPORT_CMD[sport_cmd]}
-                                )
-                                print(f"  ✓ Command sent successfully")
-                            except Exception as e:
-                                print(f"  ✗ Command failed: {e}")
-                            await asyncio.sleep(duration)
-                            
-                            # CRITICAL FIX: Re-activate movement mode after commands that disable it
-                            # Commands like StandUp, Sit, Damp, etc. deactivate movement mode
-                            if command != 'stop':  # Don't re-send StopMove after StopMove
-                                print(f"  Re-activating movement mode after {command}...")
-                                try:
-                                    await robot_connection.datachannel.pub_sub.publish_request_new(
-                                        RTC_TOPIC["SPORT_MOD"],
-                                        {"api_id": SPORT_CMD["StopMove"]}
-                                    )
-                                    await asyncio.sleep(0.3)
-                                    print(f"  ✓ Movement mode re-activated")
-                                except Exception as e:
-                                    print(f"  ⚠️  Failed to re-activate movement mode: {e}")
-                        else:
-                            print(f"  ⚠️  Unknown command: {command}")
-                    
-                    elif action == 'wait':
-                        print(f"  Waiting {duration}s...")
-                        end_time = time.time() + duration
-                        while time.time() < end_time:
-                            if sequence_abort:
-                                break
-                            await asyncio.sleep(0.1)
-                        print(f"  ✓ Wait complete")
-                    
-                    else:
-                        print(f"  ⚠️  Unknown action: {action}")
-                
-                if not sequence_abort:
-                    print(f"\n{'='*60}")
-                    print("✓ SEQUENCE COMPLETED SUCCESSFULLY")
-                    print(f"{'='*60}\n")
-                    
-            except Exception as e:
-                print(f"\n{'='*60}")
-                print(f"✗ SEQUENCE EXECUTION ERROR: {e}")
-                print(f"{'='*60}\n")
-                import traceback
-                traceback.print_exc()
-                raise
-            finally:
-                sequence_running = False
-                sequence_abort = False
-                print("Sequence state reset\n")
-        
-        future = asyncio.run_coroutine_threadsafe(run_sequence(), asyncio_loop)
-        
-        return jsonify({
-            'status': 'success',
-            'message': 'Sequence started',
-            'steps': len(sequence)
-        })
-    
+        job, position = sequence_queue.submit(plan, sequence_id)
     except Exception as e:
-        sequence_running = False
-        sequence_abort = False
         print(f"Sequence startup error: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'status': 'error', 'message': str(e)}), 500
+    
+    print(f"\n📋 Sequence {job.id} queued at position {position} - {plan.step_count} steps, ~{plan.estimated_duration:.1f}s")
+    for warning in plan.warnings:
+        print(f"⚠️  {warning}")
+    if plan.optimization:
+        print(f"⚡ Optimizer: {plan.optimization}")
+    publish_sequence_event('queued', job=job.id, position=position, total=plan.step_count,
+                           estimated_duration=plan.estimated_duration, sequence_id=sequence_id)
+    
+    return jsonify({
+        'status': 'success',
+        'message': 'Sequence queued',
+        'job_id': job.id,
+        'position': position,
+        'sequence_id': sequence_id,
+        'steps': plan.step_count,
+        'estimated_duration': plan.estimated_duration,
+        'warnings': plan.warnings,
+        'optimization': plan.optimization
+    })
+
+@app.route('/sequence/execute', methods=['POST'])
+def execute_sequence():
+    """Execute a sequence of movements"""
+    data = request.json or {}
+    try:
+        plan = sequence_compiler.compile(data.get('sequence', []))
+    except SequenceError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'errors': e.errors}), 400
+    return start_sequence(plan)
+
+@app.route('/sequence/<sequence_id>/execute', methods=['POST'])
+def execute_stored_sequence(sequence_id):
+    """Execute a sequence from the library (compiled once, then served from cache)"""
+    try:
+        plan = sequence_library.plan(sequence_id)
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Unknown sequence: {sequence_id}"}), 404
+    except SequenceError as e:
+        # e.g. saved from the other interface, with commands this one doesn't have
+        return jsonify({'status': 'error', 'message': str(e), 'errors': e.errors}), 400
+    return start_sequence(plan, sequence_id)
+
+@app.route('/sequences', methods=['GET'])
+def list_sequences():
+    """List the stored sequences"""
+    return jsonify({'status': 'success', 'sequences': sequence_library.list(), **sequence_library.stats()})
+
+@app.route('/sequences', methods=['POST'])
+@app.route('/sequences/<sequence_id>', methods=['PUT'])
+def save_sequence(sequence_id=None):
+    """Store a sequence: POST /sequences creates (409 if the id exists), PUT /sequences/<id> replaces"""
+    data = request.json or {}
+    name = data.get('name')
+    creating = sequence_id is None
+    if creating:
+        if not data.get('id') and not (isinstance(name, str) and name.strip()):
+            return jsonify({'status': 'error', 'message': 'A new sequence needs a name or an id'}), 400
+        if 'id' in data and not isinstance(data['id'], str):
+            return jsonify({'status': 'error', 'message': 'id must be a string'}), 400
+        sequence_id = data.get('id') or SequenceLibrary.make_id(name)
+    try:
+        plan = sequence_library.save(sequence_id, name, data.get('sequence', []), replace=not creating)
+    except SequenceExistsError:
+        return jsonify({'status': 'error', 'message': f"Sequence {sequence_id} already exists (use PUT to replace it)",
+                        'id': sequence_id}), 409
+    except SequenceError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'errors': e.errors}), 400
+    except OSError as e:
+        return jsonify({'status': 'error', 'message': f"Could not write sequence library: {e}"}), 500
+    return jsonify({
+        'status': 'success',
+        'id': sequence_id,
+        'steps': plan.step_count,
+        'estimated_duration': plan.estimated_duration,
+        'warnings': plan.warnings,
+        'optimization': plan.optimization
+    })
+
+@app.route('/sequences/<sequence_id>', methods=['GET'])
+def get_sequence(sequence_id):
+    """Return one stored sequence"""
+    try:
+        return jsonify({'status': 'success', **sequence_library.get(sequence_id)})
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Unknown sequence: {sequence_id}"}), 404
+
+@app.route('/sequences/<sequence_id>', methods=['DELETE'])
+def delete_sequence(sequence_id):
+    """Remove a stored sequence"""
+    try:
+        sequence_library.delete(sequence_id)
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Unknown sequence: {sequence_id}"}), 404
+    except OSError as e:
+        return jsonify({'status': 'error', 'message': f"Could not write sequence library: {e}"}), 500
+    return jsonify({'status': 'success', 'id': sequence_id})
+
+@app.route('/sequence/compile', methods=['POST'])
+def compile_sequence():
+    """Validate a sequence without running it (works while disconnected)"""
+    data = request.json or {}
+    try:
+        plan = sequence_compiler.compile(data.get('sequence', []))
+    except SequenceError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'errors': e.errors}), 400
+    return jsonify({
+        'status': 'success',
+        'steps': plan.describe(),
+        'estimated_duration': plan.estimated_duration,
+        'warnings': plan.warnings,
+        'optimization': plan.optimization
+    })
+
+@app.route('/sequence/simulate', methods=['POST'])
+def simulate_sequence():
+    """Dry-run a sequence (or a stored one by id) on a virtual clock; no robot needed"""
+    data = request.json or {}
+    try:
+        if data.get('id'):
+            plan = sequence_library.plan(data['id'])
+        else:
+            plan = sequence_compiler.compile(data.get('sequence', []))
+    except KeyError:
+        return jsonify({'status': 'error', 'message': f"Unknown sequence: {data['id']}"}), 404
+    except SequenceError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'errors': e.errors}), 400
+    
+    try:
+        latency = max(0.0, float(data.get('latency', 0.02)))  # Simulated round trip per message
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'latency must be a number'}), 400
+    
+    result = simulate_plan(plan, RTC_TOPIC["SPORT_MOD"], rate_hz=SEQUENCE_COMMAND_HZ, latency=latency)
+    return jsonify({'status': 'success', 'optimization': plan.optimization, **result})
 
 @app.route('/sequence/stop', methods=['POST'])
 def stop_sequence():
-    """Stop currently running sequence"""
-    global sequence_abort, sequence_running
-    
-    if not sequence_running:
+    """Stop the running sequence and drop everything queued behind it"""
+    if not sequence_queue.busy:
         return jsonify({
             'status': 'info',
             'message': 'No sequence is currently running'
         })
     
-    sequence_abort = True
-    print("⛔ Sequence stop requested")
+    cancelled = sequence_queue.cancel_all()  # The running job's handler sends the zero-velocity stop
+    print(f"⛔ Sequence stop requested ({cancelled} job(s) cancelled)")
     
     return jsonify({
         'status': 'success',
-        'message': 'Sequence stop signal sent'
+        'message': 'Sequence cancelled',
+        'cancelled': cancelled
     })
 
+@app.route('/sequence/queue')
+def sequence_queue_status():
+    """Running job, queued jobs in run order and recently finished ones"""
+    return jsonify({'status': 'success', **sequence_queue.jobs(), **sequence_queue.stats()})
+
+@app.route('/sequence/queue/<job_id>', methods=['DELETE'])
+def cancel_sequence_job(job_id):
+    """Cancel one job by id, whether queued or running"""
+    if not sequence_queue.cancel(job_id):
+        return jsonify({'status': 'error', 'message': f"Unknown or finished job: {job_id}"}), 404
+    print(f"⛔ Sequence {job_id} cancelled")
+    return jsonify({'status': 'success', 'job_id': job_id})
+
+@app.route('/sequence/queue/<job_id>/move', methods=['POST'])
+def move_sequence_job(job_id):
+    """Reorder a queued job: {"position": 0} makes it run next"""
+    data = request.json or {}
+    position = data.get('position')
+    if isinstance(position, bool) or not isinstance(position, int):
+        return jsonify({'status': 'error', 'message': 'position must be an integer'}), 400
+    if not sequence_queue.move(job_id, position):
+        return jsonify({'status': 'error', 'message': f"Job {job_id} is not queued"}), 404
+    return jsonify({'status': 'success', 'job_id': job_id, **sequence_queue.jobs()})
+
 @app.route('/sequence/status')
 def sequence_status():
-    """Check if sequence is currently running"""
+    """Check if a sequence is running or queued"""
+    current = sequence_queue.current
     return jsonify({
-        'running': sequence_running,
-        'abort_requested': sequence_abort
+        'running': sequence_queue.busy,
+        'current_job': current.id if current is not None else None,
+        'queued': len(sequence_queue),
+        'command_rate_hz': SEQUENCE_COMMAND_HZ,
+        **sequence_executor.stats()
     })
 
+def generate_events(last_id):
+    """Generator for the /events Server-Sent Events stream"""
+    yield 'retry: 2000\n\n'
+    for event_id, name, data in event_bus.subscribe(last_id):
+        yield format_sse(event_id, name, data)
+
+@app.route('/events')
+def events():
+    """Push connection state, current velocity and sequence step progress to the UI"""
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    return Response(generate_events(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 def generate_video():
-    """Generator for video streaming"""
-    while True:
-        if is_connected and not frame_queue.empty():
-            try:
-                frame = frame_queue.get(timeout=1)
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                if ret:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            except Exception as e:
-                pass
-        else:
-            time.sleep(0.033)
+    """Generator for video streaming - every viewer shares one JPEG encode per frame.
+    
+    Woken directly by each published frame (no sleep-polling). A None from
+    subscribe() is the idle heartbeat: end the stream if the robot went
+    away, otherwise re-send the last frame so dead clients get detected.
+    """
+    last_jpeg = None
+    for jpeg in video_broadcaster.subscribe():
+        if not is_connected:
+            return
+        if jpeg is None:
+            if last_jpeg is None:
+                continue
+            jpeg = last_jpeg
+        last_jpeg = jpeg
+        yield (b'--frame\r\n'
+               b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
 
 @app.route('/video_feed')
 def video_feed():
     return Response(generate_video(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus-style metrics: command path latencies, status codes, video and loop lag"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/snapshot')
+def snapshot():
+    """Most recent camera frame as a single JPEG (supports ETag/Last-Modified and ?width=)"""
+    width = request.args.get('width', type=int)
+    if width is not None and not 0 < width <= 4096:
+        return jsonify({'status': 'error', 'message': 'width must be between 1 and 4096'}), 400
+    
+    snap = snapshot_cache.get(width)
+    if snap is None:
+        return jsonify({'status': 'error', 'message': 'No video frame available yet'}), 503
+    
+    response = Response(snap.jpeg, mimetype='image/jpeg')
+    response.set_etag(snap.etag)
+    response.last_modified = snap.timestamp
+    response.cache_control.no_cache = True
+    # Answers 304 Not Modified when the client already has this frame
+    return response.make_conditional(request)
+
+@app.route('/record/start', methods=['POST'])
+def record_start():
+    """Start passthrough recording of the robot camera into MP4 segments"""
+    if not is_connected or not channels_ready:
+        return jsonify({
+            'status': 'error', 
+            'message': 'Not connected or channels not ready'
+        }), 400
+    
+    data = request.get_json(silent=True) or {}
+    
+    # Both are optional; omitted values fall back to the recorder's defaults for this recording
+    settings = {}
+    for key in ('segment_seconds', 'budget_mb'):
+        if data.get(key) is None:
+            continue
+        try:
+            value = float(data[key])
+        except (ValueError, TypeError):
+            value = None
+        if isinstance(data[key], bool) or value is None or not math.isfinite(value) or value <= 0:
+            return jsonify({'status': 'error', 'message': f'{key} must be a positive number'}), 400
+        settings[key] = value
+    
+    try:
+        if not video_recorder.start(**settings):
+            return jsonify({'status': 'info', 'message': 'Already recording'})
+        
+        print(f"⏺️  Recording started in {video_recorder.directory}/")
+        return jsonify({'status': 'success', 'recording': video_recorder.stats()})
+    
+    except Exception as e:
+        print(f"Recording start error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/record/stop', methods=['POST'])
+def record_stop():
+    """Stop recording and finalize the current segment"""
+    if not video_recorder.stop():
+        return jsonify({'status': 'info', 'message': 'Not recording'})
+    
+    print("⏹️  Recording stopped")
+    return jsonify({'status': 'success', 'recording': video_recorder.stats()})
+
+@app.route('/webrtc/offer', methods=['POST'])
+def webrtc_offer():
+    """Opt-in WebRTC video: forward the robot's H.264 to the browser untouched (MJPEG stays the fallback)"""
+    if not is_connected or not channels_ready:
+        return jsonify({
+            'status': 'error', 
+            'message': 'Not connected or channels not ready'
+        }), 400
+    
+    if not h264_relay.available:
+        return jsonify({
+            'status': 'error',
+            'message': 'Robot video track not available yet'
+        }), 503
+    
+    data = request.json
+    
+    try:
+        offer = RTCSessionDescription(sdp=data['sdp'], type=data['type'])
+        
+        async def negotiate():
+            pc = RTCPeerConnection()
+            webrtc_peers.add(pc)
+            track = h264_relay.subscribe()
+            
+            @pc.on("connectionstatechange")
+            async def on_connectionstatechange():
+                print(f"Browser WebRTC peer state: {pc.connectionState}")
+                if pc.connectionState in ('failed', 'closed'):
+                    track.stop()
+                    await pc.close()
+                    webrtc_peers.discard(pc)
+            
+            # The sender only packetizes the robot's access units, so H.264 is the one
+            # codec this peer may use. Preferences are applied in setRemoteDescription,
+            # so the transceiver has to exist before it (the browser's m-line binds to it)
+            transceiver = pc.addTransceiver(track, direction='sendonly')
+            transceiver.setCodecPreferences([codec for codec in RTCRtpSender.getCapabilities('video').codecs
+                                             if codec.mimeType == 'video/H264'])
+            await pc.setRemoteDescription(offer)
+            await pc.setLocalDescription(await pc.createAnswer())
+            return pc.localDescription
+        
+        future = asyncio.run_coroutine_threadsafe(negotiate(), asyncio_loop)
+        answer = future.result(timeout=10)
+        print(f"✓ Browser WebRTC video session started ({len(webrtc_peers)} active)")
+        
+        return jsonify({'sdp': answer.sdp, 'type': answer.type})
+    
+    except Exception as e:
+        if isinstance(e, concurrent.futures.TimeoutError):
+            future_timeouts.labels('/webrtc/offer').inc()
+        print(f"WebRTC offer error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 if __name__ == '__main__':
     print("=" * 60)
     print("Unitree Go2 Web Interface - Enhanced with Joystick Control")
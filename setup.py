@@ -39,4 +39,8 @@ setup(
         # Unitree WebRTC Driver (from GitHub)
         'go2-webrtc-driver @ git+https://github.com/legion1581/unitree_webrtc_connect.git',
     ],
+    extras_require={
+        # YUV-native JPEG encoding for /video_feed (needs the libturbojpeg system library)
+        'turbojpeg': ['PyTurboJPEG>=1.7.0'],
+    },
 )
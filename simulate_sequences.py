@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Offline sequence checker
+Compiles and runs sequence JSON files on a virtual clock against a simulated
+datachannel - no robot, no waiting. Exits non-zero if any sequence fails to
+compile or would send Move commands the robot ignores, so it can run in CI.
+
+Usage: python simulate_sequences.py [--interface=base|advanced] sequences.json routine.json ...
+--interface picks whose 'command' steps are allowed (default: advanced).
+A file may hold a step list, {"sequence": [...]}, or a sequence library
+({"<id>": {"name": ..., "sequence": [...]}, ...} as written by /sequences).
+"""
+
+import json
+import os
+import sys
+import time
+
+from go2_webrtc_driver.constants import RTC_TOPIC, SPORT_CMD
+from go2_sequence import SequenceCompiler, SequenceError, simulate_plan
+from go2_sequence_config import (SEQUENCE_COMMANDS, SEQUENCE_COMMAND_HZ, SEQUENCE_OPTIMIZE,
+                                 SEQUENCE_LINEAR_ACCEL, SEQUENCE_ANGULAR_ACCEL,
+                                 SEQUENCE_MAX_STEP_SECONDS, SEQUENCE_MAX_TOTAL_SECONDS,
+                                 MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED)
+
+
+def load_sequences(path):
+    """Yield (name, steps) for every sequence in a JSON file"""
+    with open(path) as f:
+        data = json.load(f)
+    name = os.path.splitext(os.path.basename(path))[0]
+    if isinstance(data, list):
+        yield name, data
+    elif isinstance(data, dict) and 'sequence' in data:
+        yield data.get('name', name), data['sequence']
+    elif isinstance(data, dict):
+        for sequence_id, entry in data.items():
+            yield sequence_id, entry.get('sequence') if isinstance(entry, dict) else entry
+    else:
+        yield name, data
+
+
+def main():
+    interface = 'advanced'
+    paths = []
+    for arg in sys.argv[1:]:
+        if arg.startswith('--interface='):
+            interface = arg.split('=', 1)[1]
+        else:
+            paths.append(arg)
+    if not paths or interface not in SEQUENCE_COMMANDS:
+        print(__doc__)
+        return 2
+
+    compiler = SequenceCompiler(SEQUENCE_COMMANDS[interface], SPORT_CMD, MAX_LINEAR_SPEED, MAX_ANGULAR_SPEED,
+                                optimize=SEQUENCE_OPTIMIZE, rate_hz=SEQUENCE_COMMAND_HZ,
+                                linear_accel=SEQUENCE_LINEAR_ACCEL, angular_accel=SEQUENCE_ANGULAR_ACCEL,
+                                max_step_duration=SEQUENCE_MAX_STEP_SECONDS,
+                                max_total_duration=SEQUENCE_MAX_TOTAL_SECONDS)
+    failed = 0
+    total = 0
+    started = time.perf_counter()
+
+    print("=" * 60)
+    print(f"Sequence Simulation - {interface} interface commands")
+    print("=" * 60)
+    for path in paths:
+        for name, steps in load_sequences(path):
+            total += 1
+            try:
+                plan = compiler.compile(steps)
+            except SequenceError as e:
+                failed += 1
+                print(f"  ✗ {name}: {len(e.errors)} error(s)")
+                for error in e.errors:
+                    print(f"      {error}")
+                continue
+            result = simulate_plan(plan, RTC_TOPIC["SPORT_MOD"], rate_hz=SEQUENCE_COMMAND_HZ)
+            pose = result['final_pose']
+            mark = '✗' if result['problems'] else '✓'
+            print(f"  {mark} {name}: {result['duration']:.2f}s, {len(result['messages'])} messages, "
+                  f"ends at x={pose['x']:.2f} y={pose['y']:.2f} yaw={pose['yaw']:.2f} "
+                  f"({result['wall_time_ms']:.1f} ms)")
+            for warning in result['warnings']:
+                print(f"      ⚠️  {warning}")
+            for problem in result['problems']:
+                print(f"      {problem}")
+            if result['problems']:
+                failed += 1
+
+    print("=" * 60)
+    print(f"{total - failed}/{total} sequences OK in {time.perf_counter() - started:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())